@@ -1,35 +1,98 @@
 import json
 import os
+import sqlite3
 from datetime import datetime
 from functools import wraps
 
 from flask import (
     Flask,
+    Response,
+    abort,
     flash,
     jsonify,
     redirect,
     render_template,
     request,
+    send_from_directory,
     session,
     url_for,
 )
+from sqlalchemy import event, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.engine import Engine
+from werkzeug.routing import IntegerConverter
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from models import Chapter, Comment, Draft, Message, Novel, User, UserSettings, db
+from models import (
+    Chapter,
+    Comment,
+    Draft,
+    InboxItem,
+    Message,
+    ModerationReview,
+    Novel,
+    User,
+    UserSettings,
+    db,
+)
+from assets import assets
+from covers import CoverError, covers
+from events import event_hub, novel_topic
+from feed import TARGET_TYPES, follow_status, load_feed, toggle_follow
+from identity import (
+    ROLES,
+    can_manage_novel,
+    current_identity,
+    identity_cache,
+    is_admin,
+    user_created,
+)
+from jobs import job_queue, start_embedded_worker
+from metrics import metrics
+from moderation import BLOCK, REVIEW, merge_results, word_filter
+from tasks import (
+    fanout_job,
+    import_cover_job,
+    process_cover_job,
+    purge_novel_job,
+    purge_user_job,
+)
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "your-secret-key-here"
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///novel.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL 模式下读写互不阻塞，写锁冲突时等待而不是立即报错；
+    auto_vacuum 只对新建的数据库生效，已有数据库由 migrate_database.py 转换"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA busy_timeout = 5000")
+        cursor.close()
+
+
 db.init_app(app)
+word_filter.init_app(app)
+metrics.init_app(app, db)
+job_queue.init_app(app)
+event_hub.init_app(app)
+assets.init_app(app)
+covers.init_app(app)
+identity_cache.init_app(app)
 
 
 # 装饰器
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if "user_id" not in session:
+        if current_identity() is None:
+            # 未登录，或用户已被删除，旧会话不再有效
+            session.clear()
             flash("请先登录", "warning")
             return redirect(url_for("login"))
         return f(*args, **kwargs)
@@ -40,11 +103,11 @@ def login_required(f):
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if "user_id" not in session:
+        if current_identity() is None:
+            session.clear()
             flash("请先登录", "warning")
             return redirect(url_for("login"))
-        user = User.query.get(session["user_id"])
-        if user.role not in ["admin", "super_admin"]:
+        if not is_admin():
             flash("权限不足", "danger")
             return redirect(url_for("index"))
         return f(*args, **kwargs)
@@ -52,10 +115,222 @@ def admin_required(f):
     return decorated_function
 
 
+# 小说
+NOVEL_STATUSES = ("ongoing", "completed")
+
+
+def get_active_novel(novel_id):
+    """加载小说，不存在或正在删除时返回 404"""
+    novel = Novel.query.get_or_404(novel_id)
+    if novel.status == "deleting":
+        abort(404)
+    return novel
+
+
+def get_managed_novel(novel_id, allow_admin=True):
+    """加载当前用户可以管理的小说，没有权限时返回 None，不存在或正在删除时返回 404"""
+    novel = get_active_novel(novel_id)
+    return novel if can_manage_novel(novel, allow_admin) else None
+
+
+# 内容审核
+def moderate(*texts):
+    """检查多个字段，返回 (处理方式, 处理后的文本列表, 命中的词)"""
+    results = [word_filter.check(text or "") for text in texts]
+    action, words = merge_results(results)
+    return action, [result.text for result in results], words
+
+
+def queue_review(content_type, content_id, novel_id, words, previous=None):
+    """将需要人工审核的内容加入审核队列，由调用方负责提交
+
+    previous 是修改前的内容，驳回修改时恢复为这个版本而不是删除整条内容。
+    """
+    db.session.add(
+        ModerationReview(
+            content_type=content_type,
+            content_id=content_id,
+            novel_id=novel_id,
+            user_id=session["user_id"],
+            matched_words=json.dumps(words, ensure_ascii=False),
+            previous_content=(
+                json.dumps(previous, ensure_ascii=False) if previous else None
+            ),
+        )
+    )
+
+
+def chapter_snapshot(chapter):
+    return {
+        "title": chapter.title,
+        "content": chapter.content,
+        "author_note": chapter.author_note,
+    }
+
+
+def supersede_chapter_review(chapter):
+    """保存修改前调用，新的修改取代尚未处理的审核，返回驳回修改时应恢复的版本
+
+    未审核的版本不能作为恢复目标，沿用被取代审核的修改前内容；被取代的是新发布
+    章节的审核时返回 None，驳回时仍然删除整章。
+    """
+    earlier = ModerationReview.query.filter_by(
+        content_type="chapter", content_id=chapter.id, status="pending"
+    ).first()
+    if earlier is None:
+        return chapter_snapshot(chapter)
+    earlier.status = "superseded"
+    earlier.reviewed_at = datetime.utcnow()
+    return json.loads(earlier.previous_content) if earlier.previous_content else None
+
+
+# 实时推送，在提交之后调用，避免推送回滚的内容
+def publish_chapter(chapter):
+    event_hub.publish(
+        novel_topic(chapter.novel_id),
+        "chapter",
+        {
+            "chapter_number": chapter.chapter_number,
+            "title": chapter.title,
+            "date": chapter.created_at.strftime("%m-%d"),
+            "url": url_for(
+                "read_chapter",
+                novel_id=chapter.novel_id,
+                chapter_number=chapter.chapter_number,
+            ),
+        },
+    )
+
+
+def queue_fanout(chapter):
+    """由后台任务把新章节写入关注者的更新收件箱"""
+    job_queue.enqueue("fanout_chapter", *fanout_job(chapter.id, chapter.created_at))
+
+
+# 封面
+def apply_cover_form(novel):
+    """根据表单更新封面：上传的文件优先，其次是封面地址；图片无效时抛出 CoverError"""
+    upload = request.files.get("cover_file")
+    if upload and upload.filename:
+        novel.cover_hash = covers.store(upload.read(covers.max_bytes + 1))
+        novel.cover_image = ""
+        return
+    url = request.form.get("cover_image", "").strip()
+    if url != (novel.cover_image or ""):
+        novel.cover_image = url
+        novel.cover_hash = None
+
+
+def queue_cover(novel):
+    """提交后生成缩略图，或把外部地址的封面转存到本地"""
+    if novel.cover_hash:
+        if not covers.is_ready(novel.cover_hash):
+            # 缩略图不存在时，之前失败或已完成的同一图片的任务也要重新执行
+            job_queue.enqueue(
+                "process_cover", *process_cover_job(novel.cover_hash), requeue=True
+            )
+    elif novel.cover_image and covers.enabled:
+        job_queue.enqueue(
+            "import_cover", *import_cover_job(novel.id, novel.cover_image)
+        )
+
+
+def publish_comment(comment):
+    event_hub.publish(
+        novel_topic(comment.novel_id),
+        "comment",
+        {
+            "username": session["username"],
+            "content": comment.content,
+            "date": comment.created_at.strftime("%Y-%m-%d %H:%M"),
+        },
+    )
+
+
+# 阅读
+CHAPTER_PLACEHOLDER = "{number}"
+
+
+class ChapterNumberConverter(IntegerConverter):
+    """章节号；构建地址时可以传入 CHAPTER_PLACEHOLDER，生成供前端替换的地址模板"""
+
+    def to_url(self, value):
+        if value == CHAPTER_PLACEHOLDER:
+            return value
+        return super().to_url(value)
+
+
+app.url_map.converters["chapter"] = ChapterNumberConverter
+
+
+def load_reading_chapter(novel_id, chapter_number):
+    """用一条查询取出章节、所属小说、作者以及上一章和下一章的章节号与标题
+
+    上一章和下一章按章节号相邻查找，中间有章节被删除时也能正确跳转。
+    找不到章节或小说正在删除时返回 None。
+    """
+    prev_chapter = aliased(Chapter)
+    next_chapter = aliased(Chapter)
+
+    def neighbour(alias, column, before):
+        query = select(column).where(alias.novel_id == Chapter.novel_id)
+        if before:
+            query = query.where(alias.chapter_number < Chapter.chapter_number)
+            query = query.order_by(alias.chapter_number.desc())
+        else:
+            query = query.where(alias.chapter_number > Chapter.chapter_number)
+            query = query.order_by(alias.chapter_number)
+        return query.limit(1).scalar_subquery()
+
+    row = db.session.execute(
+        select(
+            Chapter,
+            Novel,
+            User,
+            neighbour(prev_chapter, prev_chapter.chapter_number, True),
+            neighbour(prev_chapter, prev_chapter.title, True),
+            neighbour(next_chapter, next_chapter.chapter_number, False),
+            neighbour(next_chapter, next_chapter.title, False),
+        )
+        .join(Novel, Novel.id == Chapter.novel_id)
+        .join(User, User.id == Novel.author_id)
+        .where(
+            Chapter.novel_id == novel_id,
+            Chapter.chapter_number == chapter_number,
+            Novel.status != "deleting",
+        )
+    ).first()
+    if row is None:
+        return None
+
+    chapter, novel, author, prev_number, prev_title, next_number, next_title = row
+    return {
+        "chapter": chapter,
+        "novel": novel,
+        # 持有作者对象，novel.author 可以直接从会话中取得而不再查询
+        "author": author,
+        "prev_chapter": (
+            {"chapter_number": prev_number, "title": prev_title}
+            if prev_number is not None
+            else None
+        ),
+        "next_chapter": (
+            {"chapter_number": next_number, "title": next_title}
+            if next_number is not None
+            else None
+        ),
+    }
+
+
 # 路由
 @app.route("/")
 def index():
-    novels = Novel.query.order_by(Novel.updated_at.desc()).limit(12).all()
+    novels = (
+        Novel.query.filter(Novel.status != "deleting")
+        .order_by(Novel.updated_at.desc())
+        .limit(12)
+        .all()
+    )
     return render_template("index.html", novels=novels)
 
 
@@ -92,10 +367,11 @@ def login():
         password = request.form["password"]
         user = User.query.filter_by(username=username).first()
 
-        if user and user.check_password(password):
+        if user and user.role != "deleting" and user.check_password(password):
             session["user_id"] = user.id
             session["username"] = user.username
             session["role"] = user.role
+            session["user_created"] = user_created(user.created_at)
             flash("登录成功", "success")
             return redirect(url_for("index"))
         else:
@@ -113,7 +389,7 @@ def logout():
 
 @app.route("/novel/<int:novel_id>")
 def novel_detail(novel_id):
-    novel = Novel.query.get_or_404(novel_id)
+    novel = get_active_novel(novel_id)
     chapters = (
         Chapter.query.filter_by(novel_id=novel_id)
         .order_by(Chapter.chapter_number)
@@ -125,46 +401,156 @@ def novel_detail(novel_id):
         .limit(10)
         .all()
     )
+    following = None
+    if "user_id" in session:
+        following = follow_status(session["user_id"], novel)
     return render_template(
-        "novel_detail.html", novel=novel, chapters=chapters, comments=comments
+        "novel_detail.html",
+        novel=novel,
+        chapters=chapters,
+        comments=comments,
+        following=following,
+    )
+
+
+@app.route("/novel/<int:novel_id>/events")
+def novel_events(novel_id):
+    get_active_novel(novel_id)
+    if event_hub.is_full():
+        return Response(status=503, headers={"Retry-After": "30"})
+
+    # 响应体在请求上下文结束后才开始输出，长连接不会占用数据库会话
+    return Response(
+        event_hub.stream(novel_topic(novel_id), request.headers.get("Last-Event-ID")),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@app.route("/read/<int:novel_id>/<int:chapter_number>")
+# 关注
+@app.route("/follow/<target_type>/<int:target_id>", methods=["POST"])
+@login_required
+def follow_target(target_type, target_id):
+    if target_type not in TARGET_TYPES:
+        abort(404)
+    if target_type == "novel":
+        novel = Novel.query.get_or_404(target_id)
+        if novel.status == "deleting":
+            abort(404)
+    else:
+        user = User.query.get_or_404(target_id)
+        if user.role == "deleting":
+            abort(404)
+    if target_type == "author" and target_id == session["user_id"]:
+        flash("不能关注自己", "warning")
+        return redirect(request.referrer or url_for("feed"))
+
+    following = toggle_follow(session["user_id"], target_type, target_id)
+    db.session.commit()
+
+    flash("关注成功" if following else "已取消关注", "success")
+    return redirect(request.referrer or url_for("feed"))
+
+
+@app.route("/feed")
+@login_required
+def feed():
+    items, next_cursor = load_feed(session["user_id"], request.args.get("before"))
+    return render_template("feed.html", items=items, next_cursor=next_cursor)
+
+
+@app.route("/read/<int:novel_id>/<chapter:chapter_number>")
 def read_chapter(novel_id, chapter_number):
-    novel = Novel.query.get_or_404(novel_id)
-    chapter = Chapter.query.filter_by(
-        novel_id=novel_id, chapter_number=chapter_number
-    ).first_or_404()
+    reading = load_reading_chapter(novel_id, chapter_number)
+    if reading is None:
+        abort(404)
+
+    # 目录只需要章节号和标题，不加载正文
     chapters = (
-        Chapter.query.filter_by(novel_id=novel_id)
+        db.session.query(Chapter.chapter_number, Chapter.title)
+        .filter_by(novel_id=novel_id)
         .order_by(Chapter.chapter_number)
         .all()
     )
 
-    prev_chapter = Chapter.query.filter_by(
-        novel_id=novel_id, chapter_number=chapter_number - 1
-    ).first()
-    next_chapter = Chapter.query.filter_by(
-        novel_id=novel_id, chapter_number=chapter_number + 1
-    ).first()
-
     return render_template(
         "read.html",
-        novel=novel,
-        chapter=chapter,
         chapters=chapters,
-        prev_chapter=prev_chapter,
-        next_chapter=next_chapter,
+        placeholder=CHAPTER_PLACEHOLDER,
+        **reading,
     )
 
 
+# 阅读 API
+@app.route("/api/v1/novels/<int:novel_id>/chapters/<chapter:chapter_number>")
+def api_chapter(novel_id, chapter_number):
+    reading = load_reading_chapter(novel_id, chapter_number)
+    if reading is None:
+        return jsonify({"success": False, "error": "章节不存在"}), 404
+
+    chapter = reading["chapter"]
+    novel = reading["novel"]
+    response = jsonify(
+        {
+            "success": True,
+            "novel": {
+                "id": novel.id,
+                "title": novel.title,
+                "author": reading["author"].username,
+            },
+            "chapter": {
+                "id": chapter.id,
+                "chapter_number": chapter.chapter_number,
+                "title": chapter.title,
+                "content": chapter.content,
+                "author_note": chapter.author_note or "",
+                "created_at": chapter.created_at.isoformat(),
+                "updated_at": chapter.updated_at.isoformat(),
+            },
+            "prev_chapter": reading["prev_chapter"],
+            "next_chapter": reading["next_chapter"],
+            "url": url_for(
+                "read_chapter", novel_id=novel.id, chapter_number=chapter_number
+            ),
+        }
+    )
+    # ETag 取响应内容的哈希，章节、相邻章节或小说信息任一变化都会使其变化；
+    # 未变化时浏览器和 Service Worker 只需要一次 304
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    # 文件名带内容哈希，可以永久缓存
+    return assets.send(filename)
+
+
+@app.route("/covers/<path:filename>")
+def cover_file(filename):
+    return covers.send(filename)
+
+
+@app.route("/reader-sw.js")
+def reader_service_worker():
+    # Service Worker 需要从根路径提供，作用域才能覆盖阅读页和 API
+    response = send_from_directory(
+        app.static_folder, "js/reader_sw.js", mimetype="application/javascript"
+    )
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route("/author/dashboard")
 @login_required
 def author_dashboard():
     user_id = session["user_id"]
     novels = (
-        Novel.query.filter_by(author_id=user_id).order_by(Novel.updated_at.desc()).all()
+        Novel.query.filter_by(author_id=user_id)
+        .filter(Novel.status != "deleting")
+        .order_by(Novel.updated_at.desc())
+        .all()
     )
 
     # 计算统计信息
@@ -187,16 +573,20 @@ def create_novel():
     if request.method == "POST":
         title = request.form["title"]
         description = request.form["description"]
-        cover_image = request.form.get("cover_image", "")
 
         novel = Novel(
             title=title,
             description=description,
-            cover_image=cover_image,
             author_id=session["user_id"],
         )
+        try:
+            apply_cover_form(novel)
+        except CoverError as e:
+            flash(str(e), "danger")
+            return render_template("create_novel.html")
         db.session.add(novel)
         db.session.commit()
+        queue_cover(novel)
 
         flash("小说创建成功", "success")
         return redirect(url_for("author_dashboard"))
@@ -207,20 +597,28 @@ def create_novel():
 @app.route("/author/novel/<int:novel_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_novel(novel_id):
-    novel = Novel.query.get_or_404(novel_id)
-    if novel.author_id != session["user_id"] and session.get("role") not in [
-        "admin",
-        "super_admin",
-    ]:
+    novel = get_managed_novel(novel_id)
+    if novel is None:
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
     if request.method == "POST":
+        # 删除中的状态只能由 delete_novel 设置，表单不能覆盖
+        status = request.form["status"]
+        if status not in NOVEL_STATUSES:
+            flash("无效的连载状态", "danger")
+            return render_template("edit_novel.html", novel=novel)
         novel.title = request.form["title"]
         novel.description = request.form["description"]
-        novel.status = request.form["status"]
-        novel.cover_image = request.form.get("cover_image", "")
+        novel.status = status
+        try:
+            apply_cover_form(novel)
+        except CoverError as e:
+            db.session.rollback()
+            flash(str(e), "danger")
+            return render_template("edit_novel.html", novel=novel)
         db.session.commit()
+        queue_cover(novel)
         flash("小说信息已更新", "success")
         return redirect(url_for("author_dashboard"))
 
@@ -230,15 +628,20 @@ def edit_novel(novel_id):
 @app.route("/author/novel/<int:novel_id>/chapter/new", methods=["GET", "POST"])
 @login_required
 def create_chapter(novel_id):
-    novel = Novel.query.get_or_404(novel_id)
-    if novel.author_id != session["user_id"]:
+    novel = get_managed_novel(novel_id, allow_admin=False)
+    if novel is None:
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
     if request.method == "POST":
-        title = request.form["title"]
-        content = request.form["content"]
-        author_note = request.form.get("author_note", "")
+        action, (title, content, author_note), words = moderate(
+            request.form["title"],
+            request.form["content"],
+            request.form.get("author_note", ""),
+        )
+        if action == BLOCK:
+            flash("章节包含违规内容，无法发布", "danger")
+            return render_template("create_chapter.html", novel=novel)
 
         # 获取当前最大章节号
         last_chapter = (
@@ -257,9 +660,15 @@ def create_chapter(novel_id):
         )
         db.session.add(chapter)
 
+        if action == REVIEW:
+            db.session.flush()
+            queue_review("chapter", chapter.id, novel_id, words)
+
         # 更新小说的更新时间
         novel.updated_at = datetime.utcnow()
         db.session.commit()
+        publish_chapter(chapter)
+        queue_fanout(chapter)
 
         flash("章节发布成功", "success")
         return redirect(url_for("novel_detail", novel_id=novel_id))
@@ -271,20 +680,27 @@ def create_chapter(novel_id):
 @login_required
 def edit_chapter(chapter_id):
     chapter = Chapter.query.get_or_404(chapter_id)
-    novel = Novel.query.get(chapter.novel_id)
-
-    if novel.author_id != session["user_id"] and session.get("role") not in [
-        "admin",
-        "super_admin",
-    ]:
+    novel = get_managed_novel(chapter.novel_id)
+    if novel is None:
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
     if request.method == "POST":
-        chapter.title = request.form["title"]
-        chapter.content = request.form["content"]
-        chapter.author_note = request.form.get("author_note", "")
-        db.session.commit()
+        action, (title, content, author_note), words = moderate(
+            request.form["title"],
+            request.form["content"],
+            request.form.get("author_note", ""),
+        )
+        if action == BLOCK:
+            flash("章节包含违规内容，无法保存", "danger")
+            return render_template("edit_chapter.html", chapter=chapter, novel=novel)
+
+        previous = supersede_chapter_review(chapter)
+        chapter.title = title
+        chapter.content = content
+        chapter.author_note = author_note
+        if action == REVIEW:
+            queue_review("chapter", chapter.id, novel.id, words, previous)
 
         # 更新小说的更新时间
         novel.updated_at = datetime.utcnow()
@@ -300,34 +716,37 @@ def edit_chapter(chapter_id):
 @login_required
 def delete_chapter(chapter_id):
     chapter = Chapter.query.get_or_404(chapter_id)
-    novel = Novel.query.get(chapter.novel_id)
+    novel_id = chapter.novel_id
 
     # 检查权限
-    if novel.author_id != session["user_id"] and session.get("role") not in [
-        "admin",
-        "super_admin",
-    ]:
+    novel = get_managed_novel(novel_id)
+    if novel is None:
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
-    # 删除章节
+    # 删除章节及其在关注者收件箱中的记录
+    InboxItem.query.filter_by(chapter_id=chapter.id).delete()
     db.session.delete(chapter)
-    db.session.commit()
 
     # 更新小说的更新时间
     novel.updated_at = datetime.utcnow()
     db.session.commit()
 
     flash("章节删除成功", "success")
-    return redirect(url_for("novel_detail", novel_id=novel.id))
+    return redirect(url_for("novel_detail", novel_id=novel_id))
 
 
 @app.route("/comment/<int:novel_id>", methods=["POST"])
 @login_required
 def add_comment(novel_id):
-    content = request.form["content"]
+    get_active_novel(novel_id)
     chapter_id = request.form.get("chapter_id")
 
+    action, (content,), words = moderate(request.form["content"])
+    if action == BLOCK:
+        flash("评论包含违规内容，无法发布", "danger")
+        return redirect(url_for("novel_detail", novel_id=novel_id))
+
     comment = Comment(
         content=content,
         user_id=session["user_id"],
@@ -335,7 +754,12 @@ def add_comment(novel_id):
         chapter_id=chapter_id,
     )
     db.session.add(comment)
+
+    if action == REVIEW:
+        db.session.flush()
+        queue_review("comment", comment.id, novel_id, words)
     db.session.commit()
+    publish_comment(comment)
 
     flash("评论发布成功", "success")
     return redirect(url_for("novel_detail", novel_id=novel_id))
@@ -344,23 +768,18 @@ def add_comment(novel_id):
 @app.route("/author/novel/<int:novel_id>/delete", methods=["POST"])
 @login_required
 def delete_novel(novel_id):
-    novel = Novel.query.get_or_404(novel_id)
-
     # 检查权限
-    if novel.author_id != session["user_id"] and session.get("role") not in [
-        "admin",
-        "super_admin",
-    ]:
+    novel = get_managed_novel(novel_id)
+    if novel is None:
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
-    # 删除相关章节和评论
-    Chapter.query.filter_by(novel_id=novel_id).delete()
-    Comment.query.filter_by(novel_id=novel_id).delete()
-
-    # 删除小说
-    db.session.delete(novel)
+    # 先标记为删除中，章节、评论和草稿由后台任务删除
+    job = purge_novel_job(novel_id, novel.created_at)
+    novel.status = "deleting"
     db.session.commit()
+    # 入队前进程退出时，由工作进程的 reconcile() 补上任务
+    job_queue.enqueue("purge_novel", *job)
 
     flash("小说删除成功", "success")
     return redirect(url_for("author_dashboard"))
@@ -369,8 +788,8 @@ def delete_novel(novel_id):
 @app.route("/admin")
 @admin_required
 def admin_dashboard():
-    users = User.query.all()
-    novels = Novel.query.all()
+    users = User.query.filter(User.role != "deleting").all()
+    novels = Novel.query.filter(Novel.status != "deleting").all()
 
     # 计算统计信息
     total_chapters = sum(len(novel.chapters) for novel in novels)
@@ -402,25 +821,148 @@ def admin_dashboard():
 @app.route("/admin/user/<int:user_id>/role", methods=["POST"])
 @admin_required
 def change_user_role(user_id):
-    if session.get("role") != "super_admin":
+    if current_identity().role != "super_admin":
         flash("权限不足", "danger")
         return redirect(url_for("admin_dashboard"))
 
     user = User.query.get_or_404(user_id)
-    new_role = request.form["role"]
-    user.role = new_role
+    new_role = request.form.get("role")
+    if new_role not in ROLES:
+        flash("无效的角色", "danger")
+        return redirect(url_for("admin_dashboard"))
+    # 条件更新，避免与同时进行的删除竞争；改掉 deleting 会让删除中的用户重新登录
+    updated = User.query.filter(User.id == user_id, User.role != "deleting").update(
+        {"role": new_role}
+    )
     db.session.commit()
+    if not updated:
+        flash("该用户正在删除中，无法修改角色", "danger")
+        return redirect(url_for("admin_dashboard"))
+    identity_cache.invalidate_user(user_id)
 
     flash(f"用户 {user.username} 的角色已更新为 {new_role}", "success")
     return redirect(url_for("admin_dashboard"))
 
 
+@app.route("/metrics")
+@admin_required
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/user/<int:user_id>/delete", methods=["POST"])
+@admin_required
+def delete_user(user_id):
+    if current_identity().role != "super_admin" or user_id == session["user_id"]:
+        flash("权限不足", "danger")
+        return redirect(url_for("admin_dashboard"))
+
+    user = User.query.get_or_404(user_id)
+
+    # 先标记用户和其作品，数据由后台任务分批删除
+    user.role = "deleting"
+    Novel.query.filter_by(author_id=user_id).update({"status": "deleting"})
+    db.session.commit()
+    identity_cache.invalidate_user(user_id)
+    job_queue.enqueue("purge_user", *purge_user_job(user_id, user.created_at))
+
+    flash(f"用户 {user.username} 正在删除", "success")
+    return redirect(url_for("admin_dashboard"))
+
+
+@app.route("/admin/jobs")
+@admin_required
+def admin_jobs():
+    return render_template(
+        "admin_jobs.html", stats=job_queue.stats(), jobs=job_queue.recent()
+    )
+
+
+@app.route("/admin/jobs/<int:job_id>/retry", methods=["POST"])
+@admin_required
+def retry_job(job_id):
+    job_queue.retry(job_id)
+    flash("任务已重新加入队列", "success")
+    return redirect(url_for("admin_jobs"))
+
+
+@app.route("/admin/moderation")
+@admin_required
+def admin_moderation():
+    reviews = (
+        ModerationReview.query.filter_by(status="pending")
+        .order_by(ModerationReview.created_at)
+        .limit(100)
+        .all()
+    )
+    comment_ids = [r.content_id for r in reviews if r.content_type == "comment"]
+    chapter_ids = [r.content_id for r in reviews if r.content_type == "chapter"]
+    comments = {
+        c.id: c for c in Comment.query.filter(Comment.id.in_(comment_ids)).all()
+    }
+    chapters = {
+        c.id: c for c in Chapter.query.filter(Chapter.id.in_(chapter_ids)).all()
+    }
+
+    items = []
+    for review in reviews:
+        if review.content_type == "comment":
+            target = comments.get(review.content_id)
+        else:
+            target = chapters.get(review.content_id)
+        items.append(
+            {
+                "review": review,
+                "target": target,
+                "words": json.loads(review.matched_words or "[]"),
+            }
+        )
+    return render_template("admin_moderation.html", items=items)
+
+
+@app.route("/admin/moderation/<int:review_id>", methods=["POST"])
+@admin_required
+def review_content(review_id):
+    review = ModerationReview.query.get_or_404(review_id)
+    decision = request.form.get("decision")
+    if decision not in ("approve", "reject"):
+        flash("无效的审核操作", "danger")
+        return redirect(url_for("admin_moderation"))
+    if review.status != "pending":
+        # 已处理或已被之后的修改取代，章节可能已不是当时提交的内容
+        flash("该内容已审核或已被再次修改", "warning")
+        return redirect(url_for("admin_moderation"))
+
+    if decision == "reject":
+        if review.content_type == "comment":
+            target = Comment.query.get(review.content_id)
+        else:
+            target = Chapter.query.get(review.content_id)
+        if target and review.previous_content:
+            # 驳回对已有章节的修改时恢复修改前的版本
+            for field, value in json.loads(review.previous_content).items():
+                setattr(target, field, value)
+        elif target:
+            # 驳回新发布的评论或章节时删除，章节同时删除关注者收件箱中的记录
+            if review.content_type == "chapter":
+                InboxItem.query.filter_by(chapter_id=target.id).delete()
+            db.session.delete(target)
+        review.status = "rejected"
+    else:
+        review.status = "approved"
+    review.reviewed_at = datetime.utcnow()
+    db.session.commit()
+
+    flash("审核结果已保存", "success")
+    return redirect(url_for("admin_moderation"))
+
+
 # 笔记功能路由
 @app.route("/author/novel/<int:novel_id>/drafts")
 @login_required
 def novel_drafts(novel_id):
-    novel = Novel.query.get_or_404(novel_id)
-    if novel.author_id != session["user_id"]:
+    novel = get_managed_novel(novel_id, allow_admin=False)
+    if novel is None:
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
@@ -435,8 +977,7 @@ def novel_drafts(novel_id):
 @app.route("/author/novel/<int:novel_id>/draft/new")
 @login_required
 def create_draft(novel_id):
-    novel = Novel.query.get_or_404(novel_id)
-    if novel.author_id != session["user_id"]:
+    if get_managed_novel(novel_id, allow_admin=False) is None:
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
@@ -457,8 +998,8 @@ def edit_draft(draft_id):
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
-    novel = Novel.query.get(draft.novel_id)
-    user_settings = UserSettings.query.filter_by(user_id=session["user_id"]).first()
+    novel = get_active_novel(draft.novel_id)
+    user_settings = identity_cache.settings(session["user_id"])
 
     return render_template(
         "draft_editor.html", draft=draft, novel=novel, user_settings=user_settings
@@ -488,7 +1029,12 @@ def publish_draft(draft_id):
         flash("权限不足", "danger")
         return redirect(url_for("author_dashboard"))
 
-    novel = Novel.query.get(draft.novel_id)
+    novel = get_active_novel(draft.novel_id)
+
+    action, (title, content), words = moderate(draft.title, draft.content)
+    if action == BLOCK:
+        flash("草稿包含违规内容，无法发布", "danger")
+        return redirect(url_for("edit_draft", draft_id=draft.id))
 
     # 获取当前最大章节号
     last_chapter = (
@@ -499,13 +1045,17 @@ def publish_draft(draft_id):
     chapter_number = last_chapter.chapter_number + 1 if last_chapter else 1
 
     chapter = Chapter(
-        title=draft.title,
-        content=draft.content,
+        title=title,
+        content=content,
         chapter_number=chapter_number,
         novel_id=novel.id,
     )
     db.session.add(chapter)
 
+    if action == REVIEW:
+        db.session.flush()
+        queue_review("chapter", chapter.id, novel.id, words)
+
     # 标记草稿为已发布
     draft.is_published = True
     draft.chapter_number = chapter_number
@@ -513,6 +1063,8 @@ def publish_draft(draft_id):
     # 更新小说的更新时间
     novel.updated_at = datetime.utcnow()
     db.session.commit()
+    publish_chapter(chapter)
+    queue_fanout(chapter)
 
     flash("章节发布成功", "success")
     return redirect(url_for("novel_detail", novel_id=novel.id))
@@ -544,6 +1096,7 @@ def user_settings():
         user_settings = UserSettings(user_id=session["user_id"])
         db.session.add(user_settings)
         db.session.commit()
+        identity_cache.invalidate_settings(session["user_id"])
 
     if request.method == "POST":
         # 处理昵称更新
@@ -572,6 +1125,7 @@ def user_settings():
         user_settings.openai_model = request.form.get("openai_model", "")
 
         db.session.commit()
+        identity_cache.invalidate_settings(session["user_id"])
         flash("设置已保存", "success")
         return redirect(url_for("user_settings"))
 
@@ -581,17 +1135,17 @@ def user_settings():
 @app.route("/author/ai/assist", methods=["POST"])
 @login_required
 def ai_assist():
-    user_settings = UserSettings.query.filter_by(user_id=session["user_id"]).first()
+    user_settings = identity_cache.settings(session["user_id"])
 
-    if not user_settings or not user_settings.openai_api_key:
+    if not user_settings or not user_settings["openai_api_key"]:
         return jsonify({"success": False, "error": "请先配置AI设置"})
 
     try:
         import openai
 
         # 配置 OpenAI 设置（兼容 0.28.1 版本）
-        openai.api_key = user_settings.openai_api_key
-        openai.api_base = user_settings.openai_base_url or "https://api.deepseek.com"
+        openai.api_key = user_settings["openai_api_key"]
+        openai.api_base = user_settings["openai_base_url"] or "https://api.deepseek.com"
 
         data = request.get_json()
         prompt = data.get("prompt", "")
@@ -606,7 +1160,7 @@ def ai_assist():
         ]
 
         response = openai.ChatCompletion.create(
-            model=user_settings.openai_model or "gpt-3.5-turbo",
+            model=user_settings["openai_model"] or "gpt-3.5-turbo",
             messages=messages,
             stream=False,
         )
@@ -621,4 +1175,6 @@ def ai_assist():
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+    if app.config["JOBS_EMBEDDED_WORKER"] and os.environ.get("WERKZEUG_RUN_MAIN"):
+        start_embedded_worker(app)
     app.run(debug=True)
@@ -0,0 +1,277 @@
+"""静态资源构建与发布
+
+构建：把 static/css 和 static/js 下的文件压缩后按内容哈希重命名，输出到 static/dist，
+同时生成 gzip 预压缩文件（安装了 brotli 时还会生成 .br）以及 manifest.json。
+修改 CSS 或 JS 后需要重新构建并重启应用:
+    python assets.py
+    python assets.py --clean   # 同时删除旧版本文件
+
+发布：模板中用 asset_url('css/style.css') 代替 url_for('static', filename=...)。
+构建过的文件经 /assets/ 返回，按 Accept-Encoding 直接发送预压缩的版本，并带上一年的
+immutable 缓存头，内容变化后文件名随之变化；未构建的文件或调试模式下回退到 /static/。
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只生成 gzip
+    brotli = None
+
+SOURCE_DIRS = ("css", "js")
+# Service Worker 需要固定的地址，由 /reader-sw.js 直接提供
+EXCLUDE = {"js/reader_sw.js"}
+MANIFEST = "manifest.json"
+MAX_AGE = 365 * 24 * 3600
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+# 压缩
+def _scan(source, quotes, line_comments=False, regex=False):
+    """把源码切分为 (类型, 文本)，类型为 code、string 或 comment
+
+    字符串、正则字面量原样保留，只有 code 部分可以安全地删除空白。
+    """
+    i = start = 0
+    n = len(source)
+    last = ""  # 上一个有意义的代码片段，用来区分正则和除号
+
+    while i < n:
+        ch = source[i]
+        if ch in quotes:
+            end = i + 1
+            while end < n and source[end] != ch:
+                end += 2 if source[end] == "\\" else 1
+            end = min(end + 1, n)
+            kind = "string"
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+            kind = "comment"
+        elif line_comments and source.startswith("//", i):
+            end = source.find("\n", i)
+            end = n if end < 0 else end
+            kind = "comment"
+        elif regex and ch == "/" and _regex_allowed(source[start:i], last):
+            end = i + 1
+            in_class = False
+            while end < n and (in_class or source[end] != "/"):
+                if source[end] == "\\":
+                    end += 1
+                elif source[end] == "[":
+                    in_class = True
+                elif source[end] == "]":
+                    in_class = False
+                end += 1
+            end += 1
+            while end < n and source[end].isalpha():
+                end += 1
+            kind = "string"
+        else:
+            i += 1
+            continue
+
+        code = source[start:i]
+        if code:
+            yield "code", code
+            if code.strip():
+                last = code.strip()
+        yield kind, source[i:end]
+        if kind == "string":
+            last = "0"
+        start = i = end
+
+    if start < n:
+        yield "code", source[start:]
+
+
+def _regex_allowed(code, last):
+    """斜杠出现在运算符、括号或关键字之后时是正则字面量，否则是除号"""
+    previous = code.strip() or last
+    if not previous:
+        return True
+    if previous[-1] in "(,=:[!&|?{};+-*%<>~^":
+        return True
+    return re.search(r"\b(return|typeof|case|do|else|in|of)$", previous) is not None
+
+
+def _segments(source, quotes, line_comments=False, regex=False):
+    """删除注释并合并相邻的代码片段，返回 [(是否为代码, 文本)]"""
+    segments = []
+    for kind, text in _scan(source, quotes, line_comments, regex):
+        if kind == "comment":
+            # 块注释可能分隔两个标识符，替换为空格
+            text = " " if text.startswith("/*") else ""
+            kind = "code"
+        if kind == "code" and segments and segments[-1][0]:
+            segments[-1] = (True, segments[-1][1] + text)
+        else:
+            segments.append((kind == "code", text))
+    return segments
+
+
+def minify_css(source):
+    parts = []
+    for is_code, text in _segments(source, "'\""):
+        if is_code:
+            text = re.sub(r"\s+", " ", text)
+            text = re.sub(r" ?([{};,>]) ?", r"\1", text)
+            text = re.sub(r": ", ":", text)
+            text = text.replace(";}", "}")
+        parts.append(text)
+    return "".join(parts).strip() + "\n"
+
+
+def minify_js(source):
+    """保守的 JS 压缩：删除注释、缩进和空行，保留换行以免改变自动分号插入"""
+    parts = []
+    for is_code, text in _segments(source, "'\"`", line_comments=True, regex=True):
+        if is_code:
+            text = re.sub(r"[ \t]+", " ", text)
+            text = re.sub(r" ?\n\s*", "\n", text)
+            text = re.sub(r" ?([{}()\[\];,:=<>?!&|]) ?", r"\1", text)
+        parts.append(text)
+    return "".join(parts).strip() + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+# 构建
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build(static_folder, clean=False):
+    """构建全部资源，返回 [(源文件, 构建后的文件, 原始大小, 压缩后大小, gzip 大小)]"""
+    dist = os.path.join(static_folder, "dist")
+    if clean:
+        shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    report = []
+    for directory in SOURCE_DIRS:
+        for name in sorted(os.listdir(os.path.join(static_folder, directory))):
+            source = f"{directory}/{name}"
+            stem, ext = os.path.splitext(name)
+            if source in EXCLUDE or ext not in MINIFIERS:
+                continue
+
+            with open(os.path.join(static_folder, source), encoding="utf-8") as f:
+                original = f.read()
+            data = MINIFIERS[ext](original).encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            target = f"{directory}/{stem}.{digest}{ext}"
+            path = os.path.join(dist, target)
+
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            _write(path, data)
+            _write(path + ".gz", compressed)
+            if brotli is not None:
+                _write(path + ".br", brotli.compress(data, quality=11))
+
+            manifest[source] = target
+            report.append(
+                (source, target, len(original.encode()), len(data), len(compressed))
+            )
+
+    _write(
+        os.path.join(dist, MANIFEST),
+        json.dumps(manifest, indent=2, sort_keys=True).encode(),
+    )
+    return report
+
+
+# 发布
+class Assets:
+    def __init__(self):
+        self.dist_dir = None
+        self.max_age = MAX_AGE
+        self.manifest = {}
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "ASSETS_DIST_DIR", os.path.join(app.static_folder, "dist")
+        )
+        app.config.setdefault("ASSETS_MAX_AGE", MAX_AGE)
+
+        self.dist_dir = app.config["ASSETS_DIST_DIR"]
+        self.max_age = app.config["ASSETS_MAX_AGE"]
+        self.manifest = self.load_manifest()
+        app.jinja_env.globals["asset_url"] = self.url
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def url(self, filename):
+        """与 url_for('static', filename=...) 用法相同，优先返回构建后的地址"""
+        built = self.manifest.get(filename)
+        if built is None or current_app.debug:
+            return url_for("static", filename=filename)
+        return url_for("asset", filename=built)
+
+    def send(self, filename):
+        """返回构建后的文件，客户端支持时直接发送预压缩版本"""
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        encoding = suffix = None
+        for candidate, extension in ENCODINGS:
+            path = safe_join(self.dist_dir, filename + extension)
+            if candidate in request.accept_encodings and path and os.path.isfile(path):
+                encoding, suffix = candidate, extension
+                break
+
+        response = send_from_directory(
+            self.dist_dir,
+            filename + suffix if encoding else filename,
+            mimetype=mimetype,
+            max_age=self.max_age,
+        )
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建压缩并带内容哈希的静态资源")
+    parser.add_argument("--static", default="static", help="静态文件目录")
+    parser.add_argument("--clean", action="store_true", help="删除旧的构建结果")
+    args = parser.parse_args()
+
+    report = build(args.static, clean=args.clean)
+    total = [0, 0, 0]
+    print(f"{'文件':<32}{'原始':>10}{'压缩':>10}{'gzip':>10}")
+    for source, target, original, minified, compressed in report:
+        print(f"{source:<32}{original:>10}{minified:>10}{compressed:>10}  → {target}")
+        total[0] += original
+        total[1] += minified
+        total[2] += compressed
+    print(f"{'合计':<32}{total[0]:>10}{total[1]:>10}{total[2]:>10}")
+    if brotli is None:
+        print("未安装 brotli，只生成了 gzip 预压缩文件（pip install brotli）")
+    print(f"✓ 构建完成，共 {len(report)} 个文件，重启应用后生效")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""路由性能基准测试
+
+对 index、novel_detail、read_chapter、save_draft 和 admin_dashboard 发起请求，
+统计吞吐量、p50/p99 延迟和每个请求的 SQL 语句数，并可与保存的基线比较。
+需要先用 generate_data.py 生成测试数据。
+
+默认通过 Flask 测试客户端在进程内执行；指定 --url 时改为对已启动的服务
+发起真实 HTTP 请求，此时 SQL 语句数从 /metrics 的差值中计算。
+
+用法:
+    python benchmark.py --requests 200 --save-baseline
+    python benchmark.py --requests 200 --compare
+    python benchmark.py --url http://127.0.0.1:5000 --concurrency 8
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from app import app
+from generate_data import BENCH_ADMIN, GENERATED_PASSWORD
+from models import Chapter, Draft, Novel, User, db
+
+BASELINE_FILE = "benchmark_baseline.json"
+ROUTES = ["index", "novel_detail", "read_chapter", "save_draft", "admin_dashboard"]
+
+
+def build_plan():
+    """从数据库中挑选测试对象，返回 {路由: (方法, 路径, JSON, 登录用户)}"""
+    novel_id, chapter_count = (
+        db.session.query(Chapter.novel_id, func.count(Chapter.id))
+        .group_by(Chapter.novel_id)
+        .order_by(func.count(Chapter.id).desc())
+        .first()
+        or (None, 0)
+    )
+    draft = Draft.query.filter_by(is_published=False).first()
+    admin = User.query.filter_by(username=BENCH_ADMIN).first()
+    if not novel_id or not draft or not admin:
+        sys.exit("数据库中缺少测试数据，请先运行 generate_data.py")
+
+    novel = Novel.query.get(novel_id)
+    draft_owner = User.query.get(draft.user_id)
+    return {
+        "index": ("GET", "/", None, None),
+        "novel_detail": ("GET", f"/novel/{novel.id}", None, None),
+        "read_chapter": (
+            "GET",
+            f"/read/{novel.id}/{max(chapter_count // 2, 1)}",
+            None,
+            None,
+        ),
+        "save_draft": (
+            "POST",
+            f"/author/draft/{draft.id}/save",
+            {"title": draft.title, "content": draft.content},
+            draft_owner,
+        ),
+        "admin_dashboard": ("GET", "/admin", None, admin),
+    }
+
+
+class QueryCounter:
+    """统计进程内执行的 SQL 语句数"""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, "after_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+class TestClientDriver:
+    def __init__(self, user):
+        self.client = app.test_client()
+        if user is not None:
+            with self.client.session_transaction() as sess:
+                sess["user_id"] = user.id
+                sess["username"] = user.username
+                sess["role"] = user.role
+
+    def request(self, method, path, payload):
+        response = self.client.open(path, method=method, json=payload)
+        response.close()
+        return response.status_code
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """不跟随重定向，会话失效时跳转到登录页的请求不能算作成功"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HTTPDriver:
+    def __init__(self, base_url, user):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirectHandler
+        )
+        if user is not None:
+            form = urllib.parse.urlencode(
+                {"username": user.username, "password": GENERATED_PASSWORD}
+            ).encode()
+            # 登录成功时重定向到首页，失败时重新显示登录页
+            try:
+                self.opener.open(self.base_url + "/login", form).read()
+            except urllib.error.HTTPError as e:
+                if e.code != 302:
+                    raise
+            else:
+                raise RuntimeError(f"用户 {user.username} 登录失败")
+
+    def request(self, method, path, payload):
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(
+            self.base_url + path, data=data, method=method, headers=headers
+        )
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.close()
+            return e.code
+
+
+def scrape_statements(driver):
+    """从 /metrics 读取各路由累计执行的 SQL 语句数和请求数"""
+    try:
+        with driver.opener.open(driver.base_url + "/metrics") as response:
+            body = response.read().decode()
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"读取 /metrics 返回 {e.code}，需要以管理员身份登录")
+    totals = {}
+    pattern = r'novel_sql_statements_per_request_(sum|count)\{endpoint="(\w+)"\} (\S+)'
+    for kind, endpoint, value in re.findall(pattern, body):
+        totals.setdefault(endpoint, {})[kind] = float(value)
+    return totals
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(len(ordered) * fraction), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_route(make_driver, user, method, path, payload, requests, concurrency, warmup):
+    """并发执行请求，返回 (总耗时, 每个请求的延迟列表)
+
+    任何请求返回 3xx 及以上的状态码或抛出异常时整轮失败，抛出 RuntimeError。
+    """
+    drivers = [make_driver(user) for _ in range(concurrency)]
+    for _ in range(warmup):
+        drivers[0].request(method, path, payload)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_worker = [requests // concurrency] * concurrency
+    for i in range(requests % concurrency):
+        per_worker[i] += 1
+
+    def worker(driver, count):
+        # 线程中抛出的异常不会传到主线程，记录下来在结束后统一报告
+        local = []
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                status = driver.request(method, path, payload)
+                local.append(time.perf_counter() - start)
+                if status >= 300:
+                    raise RuntimeError(f"{method} {path} 返回 {status}")
+        except Exception as e:
+            with lock:
+                errors.append(e)
+            return
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker(drivers[0], per_worker[0])
+    else:
+        threads = [
+            threading.Thread(target=worker, args=(driver, count))
+            for driver, count in zip(drivers, per_worker)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise RuntimeError(f"{len(errors)}/{concurrency} 个并发请求失败: {errors[0]}")
+    return time.perf_counter() - start, latencies
+
+
+def run(args):
+    with app.app_context():
+        plan = build_plan()
+
+    counter = None
+    if args.url:
+        admin_driver = None
+
+        def make_driver(user):
+            return HTTPDriver(args.url, user)
+
+    else:
+        counter = QueryCounter()
+
+        def make_driver(user):
+            return TestClientDriver(user)
+
+    results = {}
+    for name in args.routes:
+        method, path, payload, user = plan[name]
+
+        if args.url:
+            with app.app_context():
+                admin_driver = admin_driver or HTTPDriver(
+                    args.url, User.query.filter_by(username=BENCH_ADMIN).first()
+                )
+            before = scrape_statements(admin_driver).get(name, {})
+        else:
+            before_count = counter.count
+
+        elapsed, latencies = run_route(
+            make_driver,
+            user,
+            method,
+            path,
+            payload,
+            args.requests,
+            args.concurrency,
+            args.warmup,
+        )
+
+        if args.url:
+            after = scrape_statements(admin_driver).get(name, {})
+            served = after.get("count", 0) - before.get("count", 0)
+            statements = after.get("sum", 0) - before.get("sum", 0)
+            queries = statements / served if served else 0.0
+        else:
+            warmed = len(latencies) + args.warmup
+            queries = (counter.count - before_count) / warmed
+
+        results[name] = {
+            "requests": len(latencies),
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queries": queries,
+        }
+    return results
+
+
+def print_report(results, baseline=None):
+    print(f"{'路由':<18}{'请求/秒':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'SQL/请求':>10}")
+    for name, result in results.items():
+        line = (
+            f"{name:<18}{result['rps']:>10.1f}{result['p50_ms']:>10.2f}"
+            f"{result['p99_ms']:>10.2f}{result['queries']:>10.1f}"
+        )
+        if baseline and name in baseline:
+            base = baseline[name]
+            line += f"   (p50 {change(result['p50_ms'], base['p50_ms'])}"
+            line += f", p99 {change(result['p99_ms'], base['p99_ms'])}"
+            line += f", SQL {base['queries']:.1f} → {result['queries']:.1f})"
+        print(line)
+
+
+def change(current, base):
+    if not base:
+        return "n/a"
+    return f"{(current - base) / base * 100:+.0f}%"
+
+
+def find_regressions(results, baseline, tolerance):
+    """延迟超过基线 tolerance 比例，或 SQL 语句数增加的路由视为退化"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key} {base[key]:.2f} → {result[key]:.2f}")
+        if result["queries"] > base["queries"] + 0.5:
+            regressions.append(
+                f"{name} SQL/请求 {base['queries']:.1f} → {result['queries']:.1f}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路由性能基准测试")
+    parser.add_argument("--requests", type=int, default=100, help="每个路由的请求数")
+    parser.add_argument("--warmup", type=int, default=5, help="预热请求数")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发数")
+    parser.add_argument("--url", help="对指定地址发起 HTTP 请求，而不是使用测试客户端")
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES)
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的延迟退化比例")
+    args = parser.parse_args()
+
+    if not args.url and args.concurrency != 1:
+        sys.exit("测试客户端模式只支持单并发，请配合 --url 使用 --concurrency")
+
+    try:
+        results = run(args)
+    except RuntimeError as e:
+        sys.exit(f"❌ 基准测试失败: {e}")
+
+    baseline = None
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✓ 基线已保存到 {args.baseline}")
+
+    if baseline:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("❌ 性能退化:")
+            for item in regressions:
+                print(f"  - {item}")
+            sys.exit(1)
+        print("✅ 未发现性能退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""小说封面
+
+封面保存在本地（COVERS_DIR，默认 instance/covers），按内容的 sha256 去重：
+- originals/ 保存上传或下载的原图，只用于重新生成缩略图，不对外提供
+- variants/<哈希前两位>/<哈希>/ 保存按 COVERS_WIDTHS 缩放的 WebP 和 JPEG 版本，
+  去除了 EXIF 等元数据，全部生成后写入 meta.json 表示可用
+
+缩放在 ProcessPoolExecutor 中进行（COVERS_WORKERS 个进程），上传后由后台任务
+process_cover 生成；填写的 URL 封面由 import_cover 下载后生成。已有的 URL 封面可以
+批量转存:
+    python covers.py --backfill --workers 4
+
+模板中用 cover_sources(novel) 获取 <picture> 需要的 srcset，缩略图未生成时回退到原 URL。
+Pillow 是可选依赖，未安装时不能上传封面，URL 封面按原样显示。
+"""
+
+import argparse
+import hashlib
+import http.client
+import io
+import ipaddress
+import json
+import multiprocessing
+import os
+import socket
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import send_from_directory, url_for
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 可选依赖
+    Image = ImageOps = None
+
+FORMATS = (("webp", "WEBP", "image/webp"), ("jpg", "JPEG", "image/jpeg"))
+META = "meta.json"
+
+
+class CoverError(ValueError):
+    """图片无法使用，消息可以直接展示给用户"""
+
+
+def public_addresses(host, port):
+    """解析主机名，所有地址都是公网地址时返回去重后的 IP 列表"""
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError:
+        raise CoverError("无法解析封面地址")
+    ips = list(dict.fromkeys(sockaddr[0] for *_, sockaddr in addresses))
+    for ip in ips:
+        if not ipaddress.ip_address(ip).is_global:
+            raise CoverError("封面地址不能指向内网")
+    return ips
+
+
+def check_public_url(url):
+    """只允许指向公网地址的 http/https 链接，避免借封面下载访问内网服务"""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise CoverError("封面地址必须是 http 或 https 链接")
+    default_port = 443 if parsed.scheme == "https" else 80
+    public_addresses(parsed.hostname, parsed.port or default_port)
+
+
+def connect_public(
+    address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None
+):
+    """连接时重新解析并校验，直接连接校验过的 IP
+
+    只在下载前校验的话，urllib 连接时会再次解析域名，攻击者可以让第二次解析指向
+    内网（DNS rebinding）。Host 头和 TLS 的 SNI、证书校验仍使用原来的主机名。
+    """
+    host, port = address
+    error = None
+    for ip in public_addresses(host, port):
+        try:
+            return socket.create_connection((ip, port), timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# 在工作进程中执行，必须是模块级函数
+def render_variants(original, output_dir, widths, quality, max_pixels):
+    """生成各尺寸的 WebP 和 JPEG，返回 meta 信息"""
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(original) as source:
+        # JPEG 可以在解码时直接缩小，大图能省下大部分解码时间
+        source.draft("RGB", (max(widths), max(widths) * 2))
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+
+    os.makedirs(output_dir, exist_ok=True)
+    variants = []
+    for width in sorted(set(min(width, image.width) for width in widths)):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        # 新图像不带 info，保存时不传 exif/icc_profile，元数据不会写入文件
+        resized.info = {}
+        for extension, format_name, _ in FORMATS:
+            path = os.path.join(output_dir, f"{width}.{extension}")
+            if format_name == "JPEG":
+                resized.save(
+                    path, format_name, quality=quality, optimize=True, progressive=True
+                )
+            else:
+                resized.save(path, format_name, quality=quality, method=6)
+        variants.append({"width": width, "height": height})
+
+    meta = {"width": image.width, "height": image.height, "variants": variants}
+    temporary = os.path.join(output_dir, META + ".tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(temporary, os.path.join(output_dir, META))
+    return meta
+
+
+class Covers:
+    def __init__(self):
+        self.directory = None
+        self.widths = (160, 320, 640)
+        self.quality = 80
+        self.max_bytes = 10 * 1024 * 1024
+        self.max_pixels = 40_000_000
+        self.workers = None
+        self._meta = {}
+        self._pool = None
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "COVERS_DIR", os.path.join(app.instance_path, "covers")
+        )
+        app.config.setdefault("COVERS_WIDTHS", (160, 320, 640))
+        app.config.setdefault("COVERS_QUALITY", 80)
+        app.config.setdefault("COVERS_MAX_BYTES", 10 * 1024 * 1024)
+        app.config.setdefault("COVERS_MAX_PIXELS", 40_000_000)
+        app.config.setdefault("COVERS_WORKERS", None)
+
+        self.directory = app.config["COVERS_DIR"]
+        self.widths = tuple(app.config["COVERS_WIDTHS"])
+        self.quality = app.config["COVERS_QUALITY"]
+        self.max_bytes = app.config["COVERS_MAX_BYTES"]
+        self.max_pixels = app.config["COVERS_MAX_PIXELS"]
+        self.workers = app.config["COVERS_WORKERS"]
+        app.jinja_env.globals["cover_sources"] = self.sources
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    # 路径
+    def original_path(self, digest):
+        return os.path.join(self.directory, "originals", digest[:2], digest)
+
+    def variant_dir(self, digest):
+        return os.path.join(self.directory, "variants", digest[:2], digest)
+
+    def meta(self, digest):
+        """返回缩略图信息，尚未生成时返回 None；生成后不会再变化，可以一直缓存"""
+        meta = self._meta.get(digest)
+        if meta is None:
+            try:
+                with open(
+                    os.path.join(self.variant_dir(digest), META), encoding="utf-8"
+                ) as f:
+                    meta = self._meta[digest] = json.load(f)
+            except FileNotFoundError:
+                return None
+        return meta
+
+    def is_ready(self, digest):
+        return self.meta(digest) is not None
+
+    # 保存原图
+    def store(self, data):
+        """校验并保存原图，返回内容哈希；相同内容只保存一次"""
+        if not self.enabled:
+            raise CoverError("服务器未安装 Pillow，暂不支持上传封面")
+        if len(data) > self.max_bytes:
+            raise CoverError(f"封面图片不能超过 {self.max_bytes // 1024 // 1024}MB")
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if image.format not in ("JPEG", "PNG", "WEBP", "GIF"):
+                    raise CoverError("封面只支持 JPG、PNG、WebP 和 GIF 格式")
+                if image.width * image.height > self.max_pixels:
+                    raise CoverError("封面图片尺寸过大")
+                image.verify()
+        except CoverError:
+            raise
+        except Exception:
+            raise CoverError("无法识别的图片文件")
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.original_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        return digest
+
+    def download(self, url, timeout=10):
+        """下载 URL 封面的原始内容，只允许访问公网的 http/https 地址"""
+        check_public_url(url)
+        # 不走环境变量中的代理，否则实际连接和解析都在代理上，无法校验目标地址
+        opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}),
+            PublicHTTPHandler,
+            PublicHTTPSHandler,
+            PublicRedirectHandler,
+        )
+        request = urllib.request.Request(url, headers={"User-Agent": "novel-covers"})
+        try:
+            with opener.open(request, timeout=timeout) as response:
+                data = response.read(self.max_bytes + 1)
+        except OSError as e:
+            raise CoverError(f"下载封面失败: {e}")
+        if len(data) > self.max_bytes:
+            raise CoverError("封面图片过大")
+        return data
+
+    # 生成缩略图
+    def pool(self):
+        if self._pool is None:
+            # 工作进程可能在多线程的 Web 进程中创建，用 spawn 避免 fork 后的锁问题
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def submit(self, digest):
+        return self.pool().submit(
+            render_variants,
+            self.original_path(digest),
+            self.variant_dir(digest),
+            self.widths,
+            self.quality,
+            self.max_pixels,
+        )
+
+    def process(self, digests):
+        """并行生成多张图片的缩略图，返回 {哈希: meta 或异常}"""
+        pending = {
+            digest: self.submit(digest)
+            for digest in set(digests)
+            if not self.is_ready(digest)
+        }
+        results = {}
+        for digest, future in pending.items():
+            try:
+                results[digest] = future.result()
+            except Exception as e:
+                results[digest] = e
+        return results
+
+    # 模板
+    def sources(self, novel):
+        """返回 <picture> 使用的地址，没有可显示的封面时返回 None"""
+        meta = self.meta(novel.cover_hash) if novel.cover_hash else None
+        if meta is None:
+            return {"src": novel.cover_image} if novel.cover_image else None
+
+        def url(variant, extension):
+            filename = f"{novel.cover_hash[:2]}/{novel.cover_hash}"
+            filename += f"/{variant['width']}.{extension}"
+            return url_for("cover_file", filename=filename)
+
+        def srcset(extension):
+            return ", ".join(
+                f"{url(variant, extension)} {variant['width']}w"
+                for variant in meta["variants"]
+            )
+
+        variants = meta["variants"]
+        default = variants[min(1, len(variants) - 1)]
+        return {
+            "src": url(default, "jpg"),
+            "webp_srcset": srcset("webp"),
+            "jpeg_srcset": srcset("jpg"),
+            "width": default["width"],
+            "height": default["height"],
+        }
+
+    def send(self, filename):
+        """缩略图按内容哈希命名，可以永久缓存"""
+        response = send_from_directory(
+            os.path.join(self.directory, "variants"),
+            filename,
+            max_age=365 * 24 * 3600,
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+covers = Covers()
+
+
+def backfill(app, workers, limit=None):
+    """把仍在使用外部 URL 的封面下载到本地并批量生成缩略图"""
+    from models import Novel, db
+
+    with app.app_context():
+        query = Novel.query.filter(
+            Novel.cover_image != "", Novel.cover_hash.is_(None)
+        ).with_entities(Novel.id, Novel.cover_image)
+        if limit:
+            query = query.limit(limit)
+        pending = query.all()
+    print(f"待转存封面 {len(pending)} 个")
+    if not pending:
+        return
+
+    def fetch(row):
+        try:
+            return row, covers.store(covers.download(row.cover_image))
+        except CoverError as e:
+            return row, e
+
+    # 下载受网络限制，用线程并发；缩放受 CPU 限制，交给进程池
+    with ThreadPoolExecutor(max_workers=workers * 4) as executor:
+        downloaded = list(executor.map(fetch, pending))
+    failures = [item for item in downloaded if isinstance(item[1], Exception)]
+    stored = [item for item in downloaded if not isinstance(item[1], Exception)]
+
+    results = covers.process(digest for _, digest in stored)
+    with app.app_context():
+        done = 0
+        for row, digest in stored:
+            error = results.get(digest)
+            if isinstance(error, Exception):
+                failures.append((row, error))
+                continue
+            Novel.query.filter_by(id=row.id, cover_image=row.cover_image).update(
+                {"cover_hash": digest, "updated_at": Novel.updated_at},
+                synchronize_session=False,
+            )
+            done += 1
+        db.session.commit()
+
+    print(f"✓ 转存完成 {done} 个，共 {len(results)} 张新图片")
+    for row, error in failures:
+        print(f"  - 小说 {row.id} {row.cover_image}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="封面图片处理")
+    parser.add_argument(
+        "--backfill", action="store_true", help="转存所有外部 URL 封面"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="缩放进程数"
+    )
+    parser.add_argument("--limit", type=int, help="最多处理的小说数")
+    args = parser.parse_args()
+
+    from app import app
+
+    if not covers.enabled:
+        raise SystemExit("需要先安装 Pillow: pip install Pillow")
+    covers.workers = args.workers
+    if args.backfill:
+        backfill(app, args.workers, args.limit)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
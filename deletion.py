@@ -0,0 +1,161 @@
+"""分批级联删除
+
+删除大量行时，单个事务会长时间持有 SQLite 的写锁，导致草稿自动保存等写操作排队超时。
+这里把删除拆成每批 DELETE_BATCH_SIZE 行的短事务，批次之间暂停 DELETE_BATCH_PAUSE 秒
+让出写锁，并在删除完成后用 incremental_vacuum 分步回收空闲页。
+
+删除顺序为先删依赖行，最后删除小说或用户本身；任务中断后重新执行会从剩余的行继续。
+"""
+
+import time
+
+from flask import current_app
+from sqlalchemy import delete, select, text
+
+from models import (
+    Chapter,
+    Comment,
+    Draft,
+    Follow,
+    InboxItem,
+    Message,
+    ModerationReview,
+    Novel,
+    User,
+    UserSettings,
+    db,
+)
+
+# 小说的依赖表及其外键列，按删除顺序排列
+NOVEL_DEPENDENTS = [
+    (InboxItem, InboxItem.novel_id),
+    (ModerationReview, ModerationReview.novel_id),
+    (Comment, Comment.novel_id),
+    (Draft, Draft.novel_id),
+    (Chapter, Chapter.novel_id),
+]
+
+# 用户自身的依赖表（不含其作品，作品按小说逐本删除）
+USER_DEPENDENTS = [
+    (InboxItem, InboxItem.user_id),
+    (Follow, Follow.user_id),
+    (ModerationReview, ModerationReview.user_id),
+    (Comment, Comment.user_id),
+    (Draft, Draft.user_id),
+    (Message, Message.user_id),
+    (UserSettings, UserSettings.user_id),
+]
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def delete_in_batches(model, condition, progress=None):
+    """按主键分批删除满足条件的行，每批单独提交，返回删除的总行数
+
+    progress(表名, 本批删除行数) 在每批提交后调用。
+    """
+    batch_size = _config("DELETE_BATCH_SIZE", 500)
+    pause = _config("DELETE_BATCH_PAUSE", 0.05)
+
+    total = 0
+    while True:
+        ids = select(model.id).where(condition).limit(batch_size).scalar_subquery()
+        result = db.session.execute(delete(model).where(model.id.in_(ids)))
+        db.session.commit()
+
+        deleted = result.rowcount
+        total += deleted
+        if progress is not None and deleted:
+            progress(model.__tablename__, deleted)
+        if deleted < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def delete_novel(novel_id, progress=None):
+    """删除小说及其全部章节、评论、草稿、审核记录和关注，返回各表删除的行数"""
+    counts = {}
+    for model, column in NOVEL_DEPENDENTS:
+        counts[model.__tablename__] = delete_in_batches(
+            model, column == novel_id, progress
+        )
+    counts["follow"] = delete_in_batches(
+        Follow,
+        (Follow.target_type == "novel") & (Follow.target_id == novel_id),
+        progress,
+    )
+    counts["novel"] = delete_in_batches(Novel, Novel.id == novel_id, progress)
+    return counts
+
+
+def delete_user(user_id, progress=None):
+    """删除用户、其全部作品以及用户在其他作品下的评论等数据"""
+    counts = {}
+    novel_ids = db.session.scalars(
+        select(Novel.id).where(Novel.author_id == user_id)
+    ).all()
+    for novel_id in novel_ids:
+        for table, deleted in delete_novel(novel_id, progress).items():
+            counts[table] = counts.get(table, 0) + deleted
+
+    for model, column in USER_DEPENDENTS:
+        table = model.__tablename__
+        counts[table] = counts.get(table, 0) + delete_in_batches(
+            model, column == user_id, progress
+        )
+    counts["follow"] += delete_in_batches(
+        Follow,
+        (Follow.target_type == "author") & (Follow.target_id == user_id),
+        progress,
+    )
+    counts["user"] = delete_in_batches(User, User.id == user_id, progress)
+    return counts
+
+
+def _incremental_vacuum(pages):
+    """执行一步 incremental_vacuum
+
+    这条 PRAGMA 每执行一步（sqlite3_step）只回收一页。sqlite3 模块的 execute() 对
+    不返回列的语句只执行一步，所以用 executescript() 在单独的连接上执行到底。
+    """
+    db.session.commit()
+    conn = db.engine.raw_connection()
+    try:
+        conn.driver_connection.executescript(f"PRAGMA incremental_vacuum({pages});")
+    finally:
+        conn.close()
+
+
+def vacuum_incrementally(progress=None):
+    """分步回收空闲页，每步释放 DELETE_VACUUM_PAGES 页，返回回收的总页数
+
+    需要数据库以 auto_vacuum = INCREMENTAL 模式创建，已有数据库可运行
+    migrate_database.py 转换；其他模式下直接返回 0。
+    """
+    pages = _config("DELETE_VACUUM_PAGES", 1000)
+    pause = _config("DELETE_BATCH_PAUSE", 0.05)
+
+    if db.session.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+        return 0
+
+    reclaimed = 0
+    free = db.session.execute(text("PRAGMA freelist_count")).scalar()
+    while free:
+        _incremental_vacuum(pages)
+        remaining = db.session.execute(text("PRAGMA freelist_count")).scalar()
+        if remaining >= free:
+            break
+        if free - remaining < min(pages, free):
+            current_app.logger.warning(
+                "incremental_vacuum 回收了 %d 页，预期 %d 页",
+                free - remaining,
+                min(pages, free),
+            )
+        reclaimed += free - remaining
+        free = remaining
+        if progress is not None:
+            progress("vacuum_pages", reclaimed)
+        time.sleep(pause)
+    return reclaimed
@@ -0,0 +1,196 @@
+"""实时更新推送
+
+进程内的发布/订阅中心，通过 Server-Sent Events 把新章节和新评论推送给正在浏览
+小说详情页的读者，读者不再需要反复刷新页面。
+
+- publish() 只把事件放入待分发队列，由唯一的分发线程统一序列化并扇出给订阅者，
+  每条事件只格式化一次，所有连接共享同一个字符串
+- 每个订阅者只有一个容量为 EVENTS_QUEUE_SIZE 的缓冲区，不单独占用线程；读取过慢的
+  连接缓冲区写满后会被清空并收到 resync 事件，由客户端自行刷新，不会拖慢其他连接
+- 每个主题保留最近 EVENTS_HISTORY_SIZE 条事件，浏览器断线重连时根据 Last-Event-ID
+  补发错过的事件，超出保留范围时同样发送 resync
+- 空闲连接每 EVENTS_HEARTBEAT_SECONDS 秒发送一次注释行，及时发现已断开的连接
+
+订阅中心只在当前进程内有效：多进程部署时同一本小说的读者必须落在发布事件的进程上。
+要在单个节点上保持数万个空闲连接，需要使用 gevent 等协程服务器运行，例如
+gunicorn -k gevent -w 1 app:app；线程模型下每个连接会占用一个请求线程。
+"""
+
+import json
+import os
+import queue
+import threading
+from collections import deque
+
+
+def novel_topic(novel_id):
+    return f"novel:{novel_id}"
+
+
+def format_event(event, data, event_id=None):
+    """格式化为 SSE 消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False))
+    return "\n".join(lines) + "\n\n"
+
+
+RESYNC = format_event("resync", {})
+HEARTBEAT = ": ping\n\n"
+
+
+class Subscriber:
+    """单个 SSE 连接的缓冲区，由分发线程写入，由连接所在的请求读取"""
+
+    __slots__ = ("topic", "size", "frames", "overflowed", "condition")
+
+    def __init__(self, topic, size):
+        self.topic = topic
+        self.size = size
+        self.frames = deque()
+        self.overflowed = False
+        self.condition = threading.Condition(threading.Lock())
+
+    def push(self, frame):
+        with self.condition:
+            if self.overflowed:
+                return
+            if len(self.frames) >= self.size:
+                # 消费过慢：丢弃积压的事件，让客户端重新加载
+                self.frames.clear()
+                self.overflowed = True
+            else:
+                self.frames.append(frame)
+            self.condition.notify()
+
+    def wait(self, timeout):
+        """等待新事件，返回待发送的消息列表，超时返回空列表"""
+        with self.condition:
+            if not self.frames and not self.overflowed:
+                self.condition.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return [RESYNC]
+            frames = list(self.frames)
+            self.frames.clear()
+            return frames
+
+
+class EventHub:
+    def __init__(self):
+        self.queue_size = 64
+        self.history_size = 50
+        self.heartbeat_seconds = 15
+        self.max_subscribers = 50000
+        self.retry_ms = 5000
+        # 事件 id 带上进程标识，进程重启后旧的 Last-Event-ID 不会被误认为有效
+        self.instance = os.urandom(4).hex()
+        self._topics = {}
+        self._history = {}
+        self._sequences = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._pending = queue.SimpleQueue()
+        self._dispatcher = None
+
+    def init_app(self, app):
+        app.config.setdefault("EVENTS_QUEUE_SIZE", 64)
+        app.config.setdefault("EVENTS_HISTORY_SIZE", 50)
+        app.config.setdefault("EVENTS_HEARTBEAT_SECONDS", 15)
+        app.config.setdefault("EVENTS_MAX_SUBSCRIBERS", 50000)
+        app.config.setdefault("EVENTS_RETRY_MS", 5000)
+
+        self.queue_size = app.config["EVENTS_QUEUE_SIZE"]
+        self.history_size = app.config["EVENTS_HISTORY_SIZE"]
+        self.heartbeat_seconds = app.config["EVENTS_HEARTBEAT_SECONDS"]
+        self.max_subscribers = app.config["EVENTS_MAX_SUBSCRIBERS"]
+        self.retry_ms = app.config["EVENTS_RETRY_MS"]
+
+    @property
+    def subscriber_count(self):
+        return self._count
+
+    def is_full(self):
+        return self._count >= self.max_subscribers
+
+    def publish(self, topic, event, data):
+        """发布事件，立即返回；实际分发在分发线程中进行"""
+        self._ensure_dispatcher()
+        self._pending.put((topic, event, data))
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is not None and self._dispatcher.is_alive():
+            return
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch, name="event-hub", daemon=True
+                )
+                self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            topic, event, data = self._pending.get()
+            with self._lock:
+                sequence = self._sequences.get(topic, 0) + 1
+                self._sequences[topic] = sequence
+                frame = format_event(event, data, f"{self.instance}-{sequence}")
+                history = self._history.get(topic)
+                if history is None:
+                    history = self._history[topic] = deque(maxlen=self.history_size)
+                history.append((sequence, frame))
+                subscribers = list(self._topics.get(topic, ()))
+            for subscriber in subscribers:
+                subscriber.push(frame)
+
+    def subscribe(self, topic, last_event_id=None):
+        """注册订阅者，并把断线期间错过的事件放入其缓冲区"""
+        subscriber = Subscriber(topic, self.queue_size)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscriber)
+            self._count += 1
+            missed = self._missed(topic, last_event_id)
+        if missed is None:
+            subscriber.overflowed = True
+        else:
+            for frame in missed:
+                subscriber.push(frame)
+        return subscriber
+
+    def _missed(self, topic, last_event_id):
+        """返回 last_event_id 之后的事件，无法补齐时返回 None"""
+        if not last_event_id:
+            return []
+        instance, _, sequence = last_event_id.partition("-")
+        if instance != self.instance or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        history = self._history.get(topic, ())
+        if history and history[0][0] > sequence + 1:
+            return None
+        return [frame for number, frame in history if number > sequence]
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._topics.get(subscriber.topic)
+            if subscribers is not None and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                self._count -= 1
+                if not subscribers:
+                    del self._topics[subscriber.topic]
+
+    def stream(self, topic, last_event_id=None):
+        """生成 SSE 响应体，连接断开时自动取消订阅"""
+        subscriber = self.subscribe(topic, last_event_id)
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            while True:
+                frames = subscriber.wait(self.heartbeat_seconds)
+                yield "".join(frames) if frames else HEARTBEAT
+        finally:
+            self.unsubscribe(subscriber)
+
+
+event_hub = EventHub()
@@ -0,0 +1,278 @@
+"""关注与更新流
+
+用户可以关注小说或作者，关注对象发布新章节后出现在用户的"我的关注"页面。
+
+- 写扩散：新章节发布后由后台任务把章节分批写入每个关注者的收件箱（InboxItem），
+  每批 FEED_FANOUT_BATCH_SIZE 行，重复执行不会产生重复记录
+- 读扩散：关注人数超过 FEED_FANOUT_THRESHOLD 的小说不再写收件箱，而是标记为
+  fanout_on_read，在用户读取更新流时直接查询这些小说的章节并与收件箱合并
+
+两条路径都按 (发布时间, 章节 id) 倒序做游标分页，翻页代价与页码无关。读扩散的小说
+只合并关注之后发布的章节；取消关注时删除不再被其他关注覆盖的收件箱记录。
+"""
+
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import (
+    DateTime,
+    and_,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+
+from models import Chapter, Follow, InboxItem, Novel, db
+
+NOVEL = "novel"
+AUTHOR = "author"
+TARGET_TYPES = (NOVEL, AUTHOR)
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+# 关注关系
+def toggle_follow(user_id, target_type, target_id):
+    """关注或取消关注，返回操作后是否处于关注状态，由调用方负责提交"""
+    removed = db.session.execute(
+        delete(Follow).where(
+            Follow.user_id == user_id,
+            Follow.target_type == target_type,
+            Follow.target_id == target_id,
+        )
+    ).rowcount
+    if removed:
+        _drop_unfollowed(user_id, target_type, target_id)
+        return False
+    db.session.add(
+        Follow(user_id=user_id, target_type=target_type, target_id=target_id)
+    )
+    return True
+
+
+def _is_following(user_id, target_type, target_id):
+    return db.session.scalar(
+        select(
+            exists().where(
+                Follow.user_id == user_id,
+                Follow.target_type == target_type,
+                Follow.target_id == target_id,
+            )
+        )
+    )
+
+
+def _drop_unfollowed(user_id, target_type, target_id):
+    """取消关注后删除收件箱中的相关章节，仍通过另一条关注覆盖的小说保留"""
+    if target_type == NOVEL:
+        author_id = db.session.scalar(
+            select(Novel.author_id).where(Novel.id == target_id)
+        )
+        if _is_following(user_id, AUTHOR, author_id):
+            return
+        novels = [target_id]
+    else:
+        followed_novels = select(Follow.target_id).where(
+            Follow.user_id == user_id, Follow.target_type == NOVEL
+        )
+        novels = select(Novel.id).where(
+            Novel.author_id == target_id, Novel.id.not_in(followed_novels)
+        )
+    db.session.execute(
+        delete(InboxItem).where(
+            InboxItem.user_id == user_id, InboxItem.novel_id.in_(novels)
+        )
+    )
+
+
+def follow_status(user_id, novel):
+    """返回用户是否关注了该小说及其作者"""
+    rows = db.session.execute(
+        select(Follow.target_type).where(
+            Follow.user_id == user_id,
+            or_(
+                and_(Follow.target_type == NOVEL, Follow.target_id == novel.id),
+                and_(Follow.target_type == AUTHOR, Follow.target_id == novel.author_id),
+            ),
+        )
+    ).scalars()
+    followed = set(rows)
+    return {NOVEL: NOVEL in followed, AUTHOR: AUTHOR in followed}
+
+
+# 写扩散
+def _audience(novel_id, author_id):
+    """关注该小说或其作者的条件"""
+    return or_(
+        and_(Follow.target_type == NOVEL, Follow.target_id == novel_id),
+        and_(Follow.target_type == AUTHOR, Follow.target_id == author_id),
+    )
+
+
+def fan_out_chapter(chapter, novel, progress=None):
+    """把章节写入关注者的收件箱，返回写入的用户数
+
+    关注人数超过阈值时把小说标记为读扩散并直接返回 0。
+    progress(已写入用户数) 在每批提交后调用。
+    """
+    threshold = _config("FEED_FANOUT_THRESHOLD", 5000)
+    batch_size = _config("FEED_FANOUT_BATCH_SIZE", 1000)
+
+    if novel.fanout_on_read:
+        return 0
+
+    audience = _audience(novel.id, novel.author_id)
+    followers = db.session.scalar(
+        select(func.count(func.distinct(Follow.user_id))).where(audience)
+    )
+    if followers > threshold:
+        # 保持 updated_at 不变，标记不影响小说的"最后更新"时间
+        db.session.execute(
+            update(Novel)
+            .where(Novel.id == novel.id)
+            .values(fanout_on_read=True, updated_at=Novel.updated_at)
+        )
+        db.session.commit()
+        return 0
+
+    total = 0
+    last_user_id = 0
+    while True:
+        user_ids = db.session.scalars(
+            select(Follow.user_id)
+            .where(audience, Follow.user_id > last_user_id)
+            .distinct()
+            .order_by(Follow.user_id)
+            .limit(batch_size)
+        ).all()
+        if not user_ids:
+            return total
+
+        # 写入时再按关注关系筛选一次，批次之间取消关注的用户不会被写入
+        db.session.execute(
+            insert(InboxItem)
+            .prefix_with("OR IGNORE")
+            .from_select(
+                ["user_id", "chapter_id", "novel_id", "created_at"],
+                select(
+                    Follow.user_id,
+                    literal(chapter.id),
+                    literal(novel.id),
+                    literal(chapter.created_at, DateTime),
+                )
+                .where(audience, Follow.user_id.in_(user_ids))
+                .distinct(),
+            )
+        )
+        db.session.commit()
+
+        total += len(user_ids)
+        last_user_id = user_ids[-1]
+        if progress is not None:
+            progress(total)
+        if len(user_ids) < batch_size:
+            return total
+
+
+# 读取更新流
+def encode_cursor(created_at, chapter_id):
+    return f"{created_at.isoformat()}_{chapter_id}"
+
+
+def decode_cursor(cursor):
+    """解析游标，格式不正确时返回 None"""
+    stamp, _, chapter_id = (cursor or "").rpartition("_")
+    try:
+        return datetime.fromisoformat(stamp), int(chapter_id)
+    except ValueError:
+        return None
+
+
+def _page(columns, condition, position, limit):
+    query = select(*columns).where(condition)
+    if position is not None:
+        query = query.where(tuple_(*columns) < tuple_(*position))
+    query = query.order_by(columns[0].desc(), columns[1].desc()).limit(limit)
+    return db.session.execute(query).all()
+
+
+def load_feed(user_id, cursor=None, limit=None):
+    """返回 (更新列表, 下一页游标)，没有更多时游标为 None"""
+    limit = limit or _config("FEED_PAGE_SIZE", 20)
+    position = decode_cursor(cursor) if cursor else None
+
+    keys = set(
+        _page(
+            (InboxItem.created_at, InboxItem.chapter_id),
+            InboxItem.user_id == user_id,
+            position,
+            limit + 1,
+        )
+    )
+
+    followed_novels = select(Follow.target_id).where(
+        Follow.user_id == user_id, Follow.target_type == NOVEL
+    )
+    followed_authors = select(Follow.target_id).where(
+        Follow.user_id == user_id, Follow.target_type == AUTHOR
+    )
+    # 读扩散的小说与写扩散一致，只取最早一条关注之后发布的章节
+    followed_at = (
+        select(func.min(Follow.created_at))
+        .where(Follow.user_id == user_id, _audience(Novel.id, Novel.author_id))
+        .scalar_subquery()
+    )
+    hot_novels = db.session.execute(
+        select(Novel.id, followed_at).where(
+            Novel.fanout_on_read.is_(True),
+            or_(Novel.id.in_(followed_novels), Novel.author_id.in_(followed_authors)),
+        )
+    ).all()
+    if hot_novels:
+        # 收件箱中可能已有标记前写入的章节，按 (发布时间, 章节 id) 去重
+        keys.update(
+            _page(
+                (Chapter.created_at, Chapter.id),
+                or_(
+                    *(
+                        and_(Chapter.novel_id == novel_id, Chapter.created_at >= since)
+                        for novel_id, since in hot_novels
+                    )
+                ),
+                position,
+                limit + 1,
+            )
+        )
+
+    ordered = sorted(keys, reverse=True)
+    page = ordered[:limit]
+    next_cursor = encode_cursor(*page[-1]) if len(ordered) > limit else None
+    if not page:
+        return [], None
+
+    rows = db.session.execute(
+        select(
+            Chapter.id,
+            Chapter.chapter_number,
+            Chapter.title,
+            Chapter.created_at,
+            Novel.id.label("novel_id"),
+            Novel.title.label("novel_title"),
+        )
+        .join(Novel, Novel.id == Chapter.novel_id)
+        .where(
+            Chapter.id.in_([chapter_id for _, chapter_id in page]),
+            Novel.status != "deleting",
+        )
+    ).all()
+    by_id = {row.id: row for row in rows}
+    items = [by_id[chapter_id] for _, chapter_id in page if chapter_id in by_id]
+    return items, next_cursor
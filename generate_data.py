@@ -0,0 +1,214 @@
+"""生成测试数据
+
+按指定规模向数据库批量写入用户、小说、章节、评论和草稿，用于性能测试。
+所有生成的用户密码均为 GENERATED_PASSWORD，另外会创建超级管理员 bench_admin。
+
+用法:
+    python generate_data.py --users 200 --novels 50 --chapters 2000
+    python generate_data.py --reset --novels 5 --chapters 5000 --chapter-chars 6000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+from werkzeug.security import generate_password_hash
+
+from app import app
+from models import Chapter, Comment, Draft, Novel, User, db
+
+GENERATED_PASSWORD = "password123"
+BENCH_ADMIN = "bench_admin"
+
+# 常用汉字，用于拼出接近真实分布的中文正文
+COMMON_CHARS = (
+    "的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后"
+    "自以会家可下而过天去能对小多然于心学么之都好看起发当没成只如事把还用第样道想作"
+    "种开美总从无情己面最女但现前些所同日手又行意动方期它头经长儿回位分爱老因很给名"
+    "法间斯知世什两次使身者被高已亲其进此话常与活正感见明问力理尔点文几定本公特做外"
+    "孩相西果走将月十实向声车全信重三机工物气每并别真打太新比才便夫再书部水像眼等体"
+    "却加电主界门利海受听表德少克代员许先口由死安写性马光白或住难望教命花结乐色更"
+    "拉东神记处让母父应直字场平报友关放至张认接告入笑内英军候民岁往何度山觉路带万男"
+    "边风解叫任金快原吃妈变通师立象数四失满战远格士音轻目条呢病始达深完今提求清王化"
+)
+PUNCTUATION = "，，，，。。。！？；："
+
+NOVEL_WORDS = ["剑", "星", "云", "梦", "山河", "长歌", "天下", "风雪", "归途", "烟火"]
+
+
+def make_text(rng, length):
+    """生成指定长度的中文段落文本"""
+    chars = rng.choices(COMMON_CHARS, k=length)
+    paragraphs = []
+    position = 0
+    while position < length:
+        size = rng.randint(80, 400)
+        paragraph = chars[position : position + size]
+        for i in range(rng.randint(8, 20), len(paragraph), rng.randint(8, 20)):
+            paragraph[i] = rng.choice(PUNCTUATION)
+        paragraphs.append("　　" + "".join(paragraph) + "。")
+        position += size
+    return "\n\n".join(paragraphs)
+
+
+def bulk_insert(model, rows, batch_size):
+    """分批执行多行 INSERT，每批一次提交"""
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(model), rows[start : start + batch_size])
+        db.session.commit()
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+
+    if args.reset:
+        db.drop_all()
+    db.create_all()
+
+    # 批量写入期间关闭同步，生成完成后恢复
+    db.session.execute(text("PRAGMA synchronous = OFF"))
+
+    password_hash = generate_password_hash(GENERATED_PASSWORD)
+    first_user_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    users = [
+        {
+            "username": f"user{first_user_id + i}",
+            "email": f"user{first_user_id + i}@example.com",
+            "password_hash": password_hash,
+            "role": "reader",
+            "created_at": now - timedelta(days=rng.randint(0, 365)),
+        }
+        for i in range(args.users)
+    ]
+    if not User.query.filter_by(username=BENCH_ADMIN).first():
+        users.append(
+            {
+                "username": BENCH_ADMIN,
+                "email": f"{BENCH_ADMIN}@example.com",
+                "password_hash": password_hash,
+                "role": "super_admin",
+                "created_at": now,
+            }
+        )
+    bulk_insert(User, users, args.batch_size)
+    user_ids = list(range(first_user_id, first_user_id + args.users))
+    print(f"✓ 用户 {len(users)}")
+
+    first_novel_id = (db.session.query(db.func.max(Novel.id)).scalar() or 0) + 1
+    novels = [
+        {
+            "title": "".join(rng.sample(NOVEL_WORDS, 2)) + f"录{i}",
+            "description": make_text(rng, rng.randint(60, 200)),
+            "author_id": rng.choice(user_ids),
+            "status": rng.choice(["ongoing", "ongoing", "completed"]),
+            "created_at": now - timedelta(days=rng.randint(30, 365)),
+            "updated_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+        }
+        for i in range(args.novels)
+    ]
+    bulk_insert(Novel, novels, args.batch_size)
+    novel_ids = list(range(first_novel_id, first_novel_id + args.novels))
+    print(f"✓ 小说 {len(novels)}")
+
+    # 章节数据量最大，按小说逐批生成，避免一次占用过多内存
+    chapter_total = 0
+    for novel_id in novel_ids:
+        created = now - timedelta(days=args.chapters)
+        rows = []
+        for number in range(1, args.chapters + 1):
+            length = rng.randint(args.chapter_chars // 2, args.chapter_chars * 3 // 2)
+            rows.append(
+                {
+                    "title": f"第{number}章 " + "".join(rng.sample(NOVEL_WORDS, 2)),
+                    "content": make_text(rng, length),
+                    "chapter_number": number,
+                    "author_note": "",
+                    "novel_id": novel_id,
+                    "created_at": created + timedelta(days=number),
+                    "updated_at": created + timedelta(days=number),
+                }
+            )
+            if len(rows) >= args.batch_size:
+                bulk_insert(Chapter, rows, args.batch_size)
+                chapter_total += len(rows)
+                rows = []
+        bulk_insert(Chapter, rows, args.batch_size)
+        chapter_total += len(rows)
+    print(f"✓ 章节 {chapter_total}")
+
+    comments = [
+        {
+            "content": make_text(rng, rng.randint(10, 120)),
+            "user_id": rng.choice(user_ids),
+            "novel_id": rng.choice(novel_ids),
+            "created_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+        }
+        for _ in range(args.comments)
+    ]
+    bulk_insert(Comment, comments, args.batch_size)
+    print(f"✓ 评论 {len(comments)}")
+
+    authors = {novel["author_id"]: [] for novel in novels}
+    for novel_id, novel in zip(novel_ids, novels):
+        authors[novel["author_id"]].append(novel_id)
+    drafts = []
+    for _ in range(args.drafts):
+        author_id = rng.choice(list(authors))
+        drafts.append(
+            {
+                "title": "草稿" + "".join(rng.sample(NOVEL_WORDS, 2)),
+                "content": make_text(rng, args.chapter_chars),
+                "novel_id": rng.choice(authors[author_id]),
+                "user_id": author_id,
+                "is_published": False,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+    bulk_insert(Draft, drafts, args.batch_size)
+    print(f"✓ 草稿 {len(drafts)}")
+
+    db.session.execute(text("PRAGMA synchronous = FULL"))
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def validate_args(parser, args):
+    """数量不能为负；小说需要作者，评论和草稿需要小说"""
+    for name in ("users", "novels", "chapters", "comments", "drafts"):
+        if getattr(args, name) < 0:
+            parser.error(f"--{name} 不能为负数")
+    if args.chapter_chars < 1 or args.batch_size < 1:
+        parser.error("--chapter-chars 和 --batch-size 必须大于 0")
+    if args.novels and not args.users:
+        parser.error("生成小说需要至少一个用户作为作者（--users）")
+    if (args.comments or args.drafts) and not args.novels:
+        parser.error("生成评论和草稿需要至少一本小说（--novels）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量生成测试数据")
+    parser.add_argument("--users", type=int, default=200, help="普通用户数")
+    parser.add_argument("--novels", type=int, default=20, help="小说数")
+    parser.add_argument("--chapters", type=int, default=1000, help="每本小说的章节数")
+    parser.add_argument("--chapter-chars", type=int, default=3000, help="章节平均字数")
+    parser.add_argument("--comments", type=int, default=5000, help="评论数")
+    parser.add_argument("--drafts", type=int, default=200, help="草稿数")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批插入的行数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--reset", action="store_true", help="清空数据库后再生成")
+    args = parser.parse_args()
+    validate_args(parser, args)
+
+    start = time.perf_counter()
+    with app.app_context():
+        generate(args)
+    print(f"🎉 数据生成完成，用时 {time.perf_counter() - start:.1f} 秒")
+    print(f"所有生成用户的密码: {GENERATED_PASSWORD}，管理员: {BENCH_ADMIN}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""请求级的身份与权限
+
+权限检查需要的用户名、角色和作者设置很少变化，却在每个需要登录的请求中重复查询。
+这里把它们以普通的元组和字典缓存在进程内，过期时间为 IDENTITY_CACHE_TTL 秒，
+每个请求第一次调用 current_identity() 时取出并保存在 g 中，之后的检查不再访问数据库。
+
+用户的 id 没有使用 AUTOINCREMENT，删除后会被复用。因此用户身份带有注册时间，
+与登录时写入会话的 user_created 不一致时说明缓存的是同一 id 的已删除用户，会重新查询。
+小说的作者不缓存，管理小说的路由本来就要加载小说，直接用 can_manage_novel() 检查。
+
+修改角色、删除用户和保存设置后调用 invalidate_user / invalidate_settings 立即失效；
+多进程部署时其他进程最多在 TTL 内看到旧数据，IDENTITY_CACHE_TTL 设为 0 可关闭缓存。
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g, session
+from sqlalchemy import select
+
+from models import User, UserSettings, db
+
+ADMIN_ROLES = ("admin", "super_admin")
+# 可以分配的角色，deleting 只由删除用户的流程设置
+ROLES = ("reader",) + ADMIN_ROLES
+SETTINGS_FIELDS = ("nickname", "openai_api_key", "openai_base_url", "openai_model")
+
+Identity = namedtuple("Identity", "user_id username role created")
+
+
+class TTLCache:
+    """带过期时间和容量上限的字典，超出容量时淘汰最早写入的条目"""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """返回缓存的值，不存在或已过期时调用 load() 加载"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > now:
+                return item[1]
+
+        value = load()
+        with self._lock:
+            self._items[key] = (now + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class IdentityCache:
+    def __init__(self):
+        self.users = TTLCache(60, 10000)
+        self.settings_cache = TTLCache(60, 10000)
+
+    def init_app(self, app):
+        app.config.setdefault("IDENTITY_CACHE_TTL", 60)
+        app.config.setdefault("IDENTITY_CACHE_SIZE", 10000)
+
+        ttl = app.config["IDENTITY_CACHE_TTL"]
+        size = app.config["IDENTITY_CACHE_SIZE"]
+        self.users = TTLCache(ttl, size)
+        self.settings_cache = TTLCache(ttl, size)
+
+    def user(self, user_id):
+        """返回 Identity，用户不存在或正在删除时返回 None"""
+
+        def load():
+            row = db.session.execute(
+                select(User.username, User.role, User.created_at).where(
+                    User.id == user_id
+                )
+            ).first()
+            if row is None or row.role == "deleting":
+                return None
+            return Identity(
+                user_id, row.username, row.role, user_created(row.created_at)
+            )
+
+        return self.users.get(user_id, load)
+
+    def settings(self, user_id):
+        """返回作者设置的字典副本，尚未保存过设置时返回 None"""
+
+        def load():
+            row = db.session.execute(
+                select(
+                    *(getattr(UserSettings, field) for field in SETTINGS_FIELDS)
+                ).where(UserSettings.user_id == user_id)
+            ).first()
+            return dict(row._mapping) if row is not None else None
+
+        settings = self.settings_cache.get(user_id, load)
+        # 返回副本，调用方修改不会影响缓存
+        return dict(settings) if settings is not None else None
+
+    def invalidate_user(self, user_id):
+        self.users.pop(user_id)
+
+    def invalidate_settings(self, user_id):
+        self.settings_cache.pop(user_id)
+
+    def clear(self):
+        self.users.clear()
+        self.settings_cache.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def user_created(created_at):
+    """登录时写入会话的注册时间，用来区分复用了同一 id 的不同用户"""
+    return created_at.timestamp() if created_at else None
+
+
+def _load_identity(user_id):
+    identity = identity_cache.user(user_id)
+    created = session.get("user_created")
+    if created is None:
+        # 旧版本登录的会话没有注册时间，无法校验
+        return identity
+    if identity is None or identity.created != created:
+        # 缓存中可能是同一 id 的已删除用户，重新查询一次
+        identity_cache.invalidate_user(user_id)
+        identity = identity_cache.user(user_id)
+        if identity is None or identity.created != created:
+            return None
+    return identity
+
+
+def current_identity():
+    """返回当前登录用户的 Identity，未登录或用户已删除时返回 None，每个请求只查询一次"""
+    if "identity" not in g:
+        user_id = session.get("user_id")
+        g.identity = _load_identity(user_id) if user_id is not None else None
+    return g.identity
+
+
+def is_admin():
+    identity = current_identity()
+    return identity is not None and identity.role in ADMIN_ROLES
+
+
+def can_manage_novel(novel, allow_admin=True):
+    """当前用户是否是小说的作者（allow_admin 时管理员也可以），不查询数据库"""
+    identity = current_identity()
+    if identity is None:
+        return False
+    return novel.author_id == identity.user_id or (
+        allow_admin and identity.role in ADMIN_ROLES
+    )
@@ -0,0 +1,402 @@
+"""后台任务队列
+
+基于独立的 SQLite 文件（JOBS_DATABASE，默认 instance/jobs.db）实现的持久化任务队列，
+与业务库分开，入队和领取任务不会占用 novel.db 的写锁。
+
+- enqueue() 写入任务，相同 idempotency key 的任务只会保存一次
+- 工作进程用 BEGIN IMMEDIATE 原子地领取任务，并持有 JOBS_LEASE_SECONDS 秒的租约，
+  进程崩溃后租约过期，任务会被其他工作进程重新领取
+- 任务每次 report_progress() 都会续租；长时间运行的任务需要定期报告进度。
+  租约已被其他工作进程接手时 report_progress() 抛出 LeaseLost，原来的处理函数随之
+  停止，complete()/fail() 也只在仍持有租约时生效
+- 任务失败后按指数退避重试，超过 max_attempts 次后标记为 failed，可在管理后台手动重试
+- 业务数据提交后、任务入队前进程退出会丢失任务，工作进程启动时以及每隔
+  JOBS_RECONCILE_INTERVAL 秒调用 tasks.reconcile()，按业务数据补上遗漏的任务
+
+任务处理函数用 @task("名称") 注册，在 tasks.py 中定义。生产环境必须单独启动工作进程，
+内置的工作线程只在 run.py 的调试模式下启动:
+    python worker.py --processes 2
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    idempotency_key VARCHAR(200) UNIQUE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    progress TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_job_status_run_at ON job (status, run_at);
+"""
+
+INSERT_JOB = (
+    "INSERT OR IGNORE INTO job (name, payload, idempotency_key, status,"
+    " max_attempts, run_at, created_at, updated_at)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+_tasks = {}
+
+
+class LeaseLost(Exception):
+    """任务租约已过期并被其他工作进程重新领取"""
+
+
+def task(name):
+    """注册任务处理函数，处理函数的第一个参数为 Job，其余参数来自 payload"""
+
+    def decorator(f):
+        _tasks[name] = f
+        return f
+
+    return decorator
+
+
+class Job:
+    """正在执行的任务"""
+
+    def __init__(self, queue, row):
+        self.queue = queue
+        self.id = row["id"]
+        self.name = row["name"]
+        self.payload = json.loads(row["payload"])
+        self.attempts = row["attempts"]
+        self.max_attempts = row["max_attempts"]
+        self.locked_until = row["locked_until"]
+
+    def report_progress(self, **progress):
+        """记录任务进度（管理后台会显示最新的进度）并续租，租约已丢失时抛出 LeaseLost"""
+        if not self.queue.heartbeat(self, progress):
+            raise LeaseLost(f"任务 {self.name} #{self.id} 的租约已被其他工作进程接手")
+
+
+class JobQueue:
+    def __init__(self):
+        self.path = None
+        self.lease_seconds = 300
+        self.retry_base_seconds = 5
+        self._schema_ready = False
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "JOBS_DATABASE", os.path.join(app.instance_path, "jobs.db")
+        )
+        app.config.setdefault("JOBS_LEASE_SECONDS", 300)
+        app.config.setdefault("JOBS_RETRY_BASE_SECONDS", 5)
+        app.config.setdefault("JOBS_POLL_INTERVAL", 1.0)
+        app.config.setdefault("JOBS_EMBEDDED_WORKER", True)
+        app.config.setdefault("JOBS_RECONCILE_INTERVAL", 600)
+        app.config.setdefault("JOBS_RECONCILE_WINDOW", 24 * 3600)
+
+        self.path = app.config["JOBS_DATABASE"]
+        self.lease_seconds = app.config["JOBS_LEASE_SECONDS"]
+        self.retry_base_seconds = app.config["JOBS_RETRY_BASE_SECONDS"]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def enqueue(
+        self, name, payload=None, key=None, delay=0, max_attempts=5, requeue=False
+    ):
+        """加入任务，返回任务 id；key 相同的任务已存在时直接返回已有任务的 id
+
+        requeue 为 True 时，已完成或已失败的同 key 任务会重置并重新排队，
+        排队中和执行中的任务不受影响。
+        """
+        now = time.time()
+        conn = self.connect()
+        try:
+            cursor = conn.execute(
+                INSERT_JOB,
+                (
+                    name,
+                    json.dumps(payload or {}, ensure_ascii=False),
+                    key,
+                    PENDING,
+                    max_attempts,
+                    now + delay,
+                    now,
+                    now,
+                ),
+            )
+            if cursor.rowcount:
+                return cursor.lastrowid
+            row = conn.execute(
+                "SELECT id FROM job WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+            if requeue:
+                conn.execute(
+                    "UPDATE job SET status = ?, attempts = 0, run_at = ?,"
+                    " locked_until = NULL, progress = NULL, last_error = NULL,"
+                    " updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                    (PENDING, now + delay, now, row["id"], DONE, FAILED),
+                )
+            return row["id"]
+        finally:
+            conn.close()
+
+    def enqueue_many(self, name, jobs, max_attempts=5):
+        """在一个事务中加入多个任务，返回新加入的任务数
+
+        jobs 为 [(payload, key)]，key 已存在的任务直接跳过。
+        """
+        if not jobs:
+            return 0
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            added = 0
+            for payload, key in jobs:
+                added += conn.execute(
+                    INSERT_JOB,
+                    (
+                        name,
+                        json.dumps(payload or {}, ensure_ascii=False),
+                        key,
+                        PENDING,
+                        max_attempts,
+                        now,
+                        now,
+                        now,
+                    ),
+                ).rowcount
+            conn.execute("COMMIT")
+            return added
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim(self):
+        """领取一个到期的任务，没有任务时返回 None"""
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM job"
+                " WHERE (status = ? AND run_at <= ?)"
+                " OR (status = ? AND locked_until < ?)"
+                " ORDER BY run_at LIMIT 1",
+                (PENDING, now, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            locked_until = now + self.lease_seconds
+            conn.execute(
+                "UPDATE job SET status = ?, attempts = attempts + 1,"
+                " locked_until = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, locked_until, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+            row = dict(row)
+            row["attempts"] += 1
+            row["locked_until"] = locked_until
+            return Job(self, row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update(self, job_id, where="", params=(), **fields):
+        """更新任务字段，where 为附加条件，返回是否有任务被更新"""
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        conn = self.connect()
+        try:
+            cursor = conn.execute(
+                f"UPDATE job SET {columns} WHERE id = ?{where}",
+                (*fields.values(), job_id, *params),
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def _update_held(self, job, **fields):
+        """只在 job 仍持有领取时的租约时更新；重新领取会增加 attempts 并更换 locked_until"""
+        return self._update(
+            job.id,
+            " AND status = ? AND attempts = ? AND locked_until = ?",
+            (RUNNING, job.attempts, job.locked_until),
+            **fields,
+        )
+
+    def heartbeat(self, job, progress=None):
+        """续租并记录进度，返回是否仍持有租约"""
+        locked_until = time.time() + self.lease_seconds
+        fields = {"locked_until": locked_until}
+        if progress is not None:
+            fields["progress"] = json.dumps(progress, ensure_ascii=False)
+        if not self._update_held(job, **fields):
+            return False
+        job.locked_until = locked_until
+        return True
+
+    def complete(self, job):
+        """标记任务完成，返回是否仍持有租约"""
+        return self._update_held(job, status=DONE, locked_until=None, last_error=None)
+
+    def fail(self, job, error):
+        """任务失败，未超过最大次数时按指数退避重新排队；返回是否仍持有租约"""
+        if job.attempts < job.max_attempts:
+            delay = self.retry_base_seconds * 2 ** (job.attempts - 1)
+            return self._update_held(
+                job,
+                status=PENDING,
+                run_at=time.time() + delay,
+                locked_until=None,
+                last_error=error,
+            )
+        return self._update_held(
+            job, status=FAILED, locked_until=None, last_error=error
+        )
+
+    def retry(self, job_id):
+        """将失败的任务重新放回队列"""
+        self._update(
+            job_id,
+            " AND status = ?",
+            (FAILED,),
+            status=PENDING,
+            attempts=0,
+            run_at=time.time(),
+            last_error=None,
+        )
+
+    def stats(self):
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS total FROM job GROUP BY status"
+            ).fetchall()
+            return {row["status"]: row["total"] for row in rows}
+        finally:
+            conn.close()
+
+    def recent(self, limit=50):
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM job ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+            jobs.append(job)
+        return jobs
+
+
+job_queue = JobQueue()
+
+
+def run_job(app, job):
+    """在应用上下文中执行任务，异常时回滚会话并按重试策略处理"""
+    from models import db
+
+    handler = _tasks.get(job.name)
+    with app.app_context():
+        try:
+            if handler is None:
+                raise LookupError(f"未注册的任务: {job.name}")
+            handler(job, **job.payload)
+        except LeaseLost as e:
+            # 任务已由其他工作进程接手，不再修改任务状态
+            db.session.rollback()
+            app.logger.warning("%s", e)
+            return False
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("任务执行失败: %s #%s", job.name, job.id)
+            job_queue.fail(job, traceback.format_exc(limit=5))
+            return False
+        if not job_queue.complete(job):
+            app.logger.warning(
+                "任务 %s #%s 完成时租约已被其他工作进程接手", job.name, job.id
+            )
+            return False
+    return True
+
+
+def reconcile(app):
+    """按业务数据补上遗漏的任务，返回新加入的任务数，出错时只记录日志"""
+    import tasks
+    from models import db
+
+    with app.app_context():
+        try:
+            added = tasks.reconcile(app.config["JOBS_RECONCILE_WINDOW"])
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("检查遗漏的任务失败")
+            return 0
+    if added:
+        app.logger.warning("补上了 %d 个遗漏的任务", added)
+    return added
+
+
+def work(app, stop_event=None, poll_interval=None):
+    """循环领取并执行任务，直到 stop_event 被设置
+
+    启动时以及每隔 JOBS_RECONCILE_INTERVAL 秒调用 reconcile()，设为 0 时不检查。
+    """
+    import tasks  # noqa: F401  注册任务处理函数
+
+    if poll_interval is None:
+        poll_interval = app.config["JOBS_POLL_INTERVAL"]
+    reconcile_interval = app.config["JOBS_RECONCILE_INTERVAL"]
+    next_reconcile = time.time()
+    while stop_event is None or not stop_event.is_set():
+        if reconcile_interval and time.time() >= next_reconcile:
+            reconcile(app)
+            next_reconcile = time.time() + reconcile_interval
+        job = job_queue.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(app, job)
+
+
+def start_embedded_worker(app):
+    """在当前进程中启动后台线程处理任务，适用于开发环境的单进程部署"""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=work, args=(app, stop_event), name="job-worker", daemon=True
+    )
+    thread.start()
+    return stop_event
@@ -0,0 +1,342 @@
+"""请求、SQL 和模板渲染的性能统计
+
+按路由（endpoint）记录请求耗时直方图、SQL 语句数、查询返回的行数、ORM 加载的
+实体数、加载的章节正文字节数以及 Jinja 渲染耗时，并以 Prometheus 文本格式输出。
+行数统计会话中执行的所有查询，包括 select(列) 和 text() 查询；实体数只统计
+加载为模型对象的行。使用 yield_per 或 stream_results 流式读取的查询不计行数。
+
+同一请求中相同的 SQL 语句重复执行达到 METRICS_N_PLUS_ONE_THRESHOLD 次时
+视为 N+1 查询，计入 novel_sql_repeated_statements_total 并写入日志。
+
+设置 METRICS_SLOW_REQUEST_MS 后开启慢请求日志，超过阈值的请求会记录完整的
+SQL 列表；METRICS_PROFILE_SAMPLE_RATE 大于 0 时按比例对请求做 cProfile 采样，
+慢请求日志中会附带采样到的函数耗时排行。
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import random
+import threading
+import time
+from collections import Counter
+
+from flask import before_render_template, g, has_request_context, request
+from flask import template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.responses = Counter()
+        self.rows = 0
+        self.entities = 0
+        self.content_bytes = 0
+        self.render_seconds = 0.0
+        self.repeated_statements = 0
+
+
+class RequestStats:
+    """单个请求的统计，保存在 g 上"""
+
+    def __init__(self, record_queries):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.rows = 0
+        self.entities = 0
+        self.content_bytes = 0
+        self.render_seconds = 0.0
+        self.render_starts = []
+        self.sql_counts = Counter()
+        self.queries = [] if record_queries else None
+        self.profiler = None
+        self.status = 500
+
+
+def _current():
+    if not has_request_context():
+        return None
+    return g.get("_metrics")
+
+
+class Metrics:
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+        self.slow_request_ms = None
+        self.profile_sample_rate = 0.0
+        self.n_plus_one_threshold = 5
+        self.logger = None
+
+    def init_app(self, app, db):
+        app.config.setdefault("METRICS_SLOW_REQUEST_MS", None)
+        app.config.setdefault("METRICS_PROFILE_SAMPLE_RATE", 0.0)
+        app.config.setdefault("METRICS_N_PLUS_ONE_THRESHOLD", 5)
+
+        self.slow_request_ms = app.config["METRICS_SLOW_REQUEST_MS"]
+        self.profile_sample_rate = app.config["METRICS_PROFILE_SAMPLE_RATE"]
+        self.n_plus_one_threshold = app.config["METRICS_N_PLUS_ONE_THRESHOLD"]
+        self.logger = app.logger
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+
+        event.listen(Engine, "before_cursor_execute", self._before_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_execute)
+        event.listen(Session, "do_orm_execute", self._on_orm_execute)
+        event.listen(db.Model, "load", self._on_load, propagate=True)
+
+    # 请求生命周期
+    def _before_request(self):
+        stats = RequestStats(record_queries=self.slow_request_ms is not None)
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                stats.profiler = profiler
+            except ValueError:
+                # 同一线程已有其他分析器在运行
+                pass
+        g._metrics = stats
+
+    def _after_request(self, response):
+        stats = _current()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        stats = _current()
+        if stats is None:
+            return
+        g._metrics = None
+        elapsed = time.perf_counter() - stats.start
+        if stats.profiler is not None:
+            stats.profiler.disable()
+
+        endpoint = request.endpoint or "unmatched"
+        repeated = sum(
+            count - 1
+            for count in stats.sql_counts.values()
+            if count >= self.n_plus_one_threshold
+        )
+
+        with self._lock:
+            route = self.routes.get(endpoint)
+            if route is None:
+                route = self.routes[endpoint] = RouteStats()
+            route.latency.observe(elapsed)
+            route.statements.observe(stats.statements)
+            route.responses[stats.status] += 1
+            route.rows += stats.rows
+            route.entities += stats.entities
+            route.content_bytes += stats.content_bytes
+            route.render_seconds += stats.render_seconds
+            route.repeated_statements += repeated
+
+        if repeated:
+            worst, count = stats.sql_counts.most_common(1)[0]
+            self.logger.warning(
+                "疑似 N+1 查询: %s 同一语句执行 %d 次: %s", endpoint, count, worst
+            )
+
+        if self.slow_request_ms is not None and elapsed * 1000 >= self.slow_request_ms:
+            self._log_slow_request(endpoint, elapsed, stats)
+
+    def _log_slow_request(self, endpoint, elapsed, stats):
+        entry = {
+            "endpoint": endpoint,
+            "path": request.path,
+            "method": request.method,
+            "status": stats.status,
+            "ms": round(elapsed * 1000, 2),
+            "statements": stats.statements,
+            "rows": stats.rows,
+            "orm_entities": stats.entities,
+            "content_bytes": stats.content_bytes,
+            "render_ms": round(stats.render_seconds * 1000, 2),
+            "queries": stats.queries,
+        }
+        if stats.profiler is not None:
+            output = io.StringIO()
+            pstats.Stats(stats.profiler, stream=output).sort_stats(
+                "cumulative"
+            ).print_stats(20)
+            entry["profile"] = output.getvalue()
+        self.logger.warning("慢请求: %s", json.dumps(entry, ensure_ascii=False))
+
+    # 模板渲染
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None:
+            stats.render_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None and stats.render_starts:
+            stats.render_seconds += time.perf_counter() - stats.render_starts.pop()
+
+    # SQL
+    # 开始时间保存在每条语句的执行上下文上，语句出错时随上下文一起丢弃
+    def _before_execute(self, conn, cursor, statement, parameters, context, many):
+        if context is not None and _current() is not None:
+            context._metrics_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, many):
+        stats = _current()
+        if stats is None:
+            return
+        start = getattr(context, "_metrics_start", None)
+        elapsed = time.perf_counter() - start if start is not None else 0.0
+        stats.statements += 1
+        stats.sql_counts[statement] += 1
+        if stats.queries is not None:
+            stats.queries.append(
+                {"sql": statement, "ms": round(elapsed * 1000, 3)}
+            )
+
+    def _on_orm_execute(self, orm_execute_state):
+        """执行查询并缓存结果以统计行数，流式读取的查询保持原样"""
+        stats = _current()
+        if stats is None:
+            return None
+        state = orm_execute_state
+        if state.is_insert or state.is_update or state.is_delete:
+            return None
+        options = state.execution_options
+        if options.get("yield_per") or options.get("stream_results"):
+            return None
+        result = state.invoke_statement()
+        # text() 写语句返回不带行的 CursorResult，ORM 查询的结果总是带行
+        if not getattr(result, "returns_rows", True):
+            return result
+        frozen = result.freeze()
+        stats.rows += len(frozen.data)
+        return frozen()
+
+    def _on_load(self, target, context):
+        stats = _current()
+        if stats is None:
+            return
+        stats.entities += 1
+        if target.__tablename__ == "chapter":
+            content = target.__dict__.get("content")
+            if content:
+                stats.content_bytes += len(content.encode("utf-8"))
+
+    # 输出
+    def render(self):
+        """以 Prometheus 文本格式输出所有指标"""
+        with self._lock:
+            routes = sorted(self.routes.items())
+            lines = []
+
+            def header(name, kind, text):
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+            def histogram(name, attr):
+                for endpoint, route in routes:
+                    hist = getattr(route, attr)
+                    for bound, count in hist.cumulative():
+                        lines.append(
+                            f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}'
+                        )
+                    lines.append(
+                        f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {hist.total}'
+                    )
+                    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {hist.sum}')
+                    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {hist.total}')
+
+            def counter(name, attr):
+                for endpoint, route in routes:
+                    value = getattr(route, attr)
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+
+            header(
+                "novel_request_duration_seconds", "histogram", "请求处理耗时"
+            )
+            histogram("novel_request_duration_seconds", "latency")
+
+            header("novel_requests_total", "counter", "按状态码统计的请求数")
+            for endpoint, route in routes:
+                for status, count in sorted(route.responses.items()):
+                    lines.append(
+                        f'novel_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}'
+                    )
+
+            header(
+                "novel_sql_statements_per_request",
+                "histogram",
+                "每个请求执行的 SQL 语句数",
+            )
+            histogram("novel_sql_statements_per_request", "statements")
+
+            header(
+                "novel_sql_rows_loaded_total",
+                "counter",
+                "会话中查询返回的行数，包括只查询列的语句",
+            )
+            counter("novel_sql_rows_loaded_total", "rows")
+
+            header(
+                "novel_orm_entities_loaded_total",
+                "counter",
+                "ORM 加载的模型对象数，只查询列的语句不计入",
+            )
+            counter("novel_orm_entities_loaded_total", "entities")
+
+            header(
+                "novel_sql_repeated_statements_total",
+                "counter",
+                "疑似 N+1 的重复 SQL 语句数",
+            )
+            counter("novel_sql_repeated_statements_total", "repeated_statements")
+
+            header(
+                "novel_chapter_content_bytes_total", "counter", "加载的章节正文字节数"
+            )
+            counter("novel_chapter_content_bytes_total", "content_bytes")
+
+            header(
+                "novel_template_render_seconds_total", "counter", "Jinja 模板渲染耗时"
+            )
+            counter("novel_template_render_seconds_total", "render_seconds")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -90,7 +90,72 @@ def migrate_database():
         else:
             print("✓ draft表已存在")
 
+        # 按小说和章节号查找章节的索引
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='chapter'"
+        )
+        if cursor.fetchone():
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_chapter_novel_number"
+                " ON chapter (novel_id, chapter_number)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_chapter_novel_created"
+                " ON chapter (novel_id, created_at)"
+            )
+            print("✓ chapter表索引已创建")
+
+        # 关注更新流的读扩散标记和本地封面（follow 和 inbox_item 表由 db.create_all() 创建）
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='novel'"
+        )
+        if cursor.fetchone():
+            cursor.execute("PRAGMA table_info(novel)")
+            columns = [column[1] for column in cursor.fetchall()]
+            if "fanout_on_read" not in columns:
+                print("正在添加fanout_on_read字段到novel表...")
+                cursor.execute(
+                    "ALTER TABLE novel ADD COLUMN fanout_on_read BOOLEAN DEFAULT 0"
+                )
+                print("✓ novel表迁移完成")
+            else:
+                print("✓ novel表已包含fanout_on_read字段")
+            if "cover_hash" not in columns:
+                print("正在添加cover_hash字段到novel表...")
+                cursor.execute("ALTER TABLE novel ADD COLUMN cover_hash VARCHAR(64)")
+                print("✓ novel表封面字段添加完成")
+            else:
+                print("✓ novel表已包含cover_hash字段")
+
+        # 审核队列保存章节修改前的内容（表由 db.create_all() 创建）
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+            " AND name='moderation_review'"
+        )
+        if cursor.fetchone():
+            cursor.execute("PRAGMA table_info(moderation_review)")
+            columns = [column[1] for column in cursor.fetchall()]
+            if "previous_content" not in columns:
+                print("正在添加previous_content字段到moderation_review表...")
+                cursor.execute(
+                    "ALTER TABLE moderation_review ADD COLUMN previous_content TEXT"
+                )
+                print("✓ moderation_review表迁移完成")
+            else:
+                print("✓ moderation_review表已包含previous_content字段")
+
         conn.commit()
+
+        # 检查是否已开启增量 VACUUM，分批删除后需要用它回收空间
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            print("正在开启增量 VACUUM（需要重建数据库文件，可能需要一段时间）...")
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+            print("✓ 增量 VACUUM 已开启")
+        else:
+            print("✓ 增量 VACUUM 已开启")
+
         print("🎉 数据库迁移完成！")
 
     except Exception as e:
@@ -29,8 +29,12 @@ class Novel(db.Model):
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     cover_image = db.Column(db.String(300))
+    # 本地封面原图的 sha256，缩略图见 covers.py；cover_image 保留为外部地址
+    cover_hash = db.Column(db.String(64))
     author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     status = db.Column(db.String(20), default="ongoing")
+    # 关注人数超过 FEED_FANOUT_THRESHOLD 后改为读取时合并，标记后不再恢复
+    fanout_on_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
@@ -42,6 +46,11 @@ class Novel(db.Model):
 
 
 class Chapter(db.Model):
+    __table_args__ = (
+        db.Index("ix_chapter_novel_number", "novel_id", "chapter_number"),
+        db.Index("ix_chapter_novel_created", "novel_id", "created_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
@@ -97,3 +106,48 @@ class UserSettings(db.Model):
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
+
+
+class ModerationReview(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    content_type = db.Column(db.String(20), nullable=False)
+    content_id = db.Column(db.Integer, nullable=False)
+    novel_id = db.Column(db.Integer, db.ForeignKey("novel.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    matched_words = db.Column(db.Text, default="")
+    # 修改已有章节时保存修改前的标题、正文和作者的话（JSON），驳回时恢复
+    previous_content = db.Column(db.Text, nullable=True)
+    # pending、approved、rejected，或 superseded（审核前章节又被修改）
+    status = db.Column(db.String(20), default="pending", index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reviewed_at = db.Column(db.DateTime, nullable=True)
+
+
+class Follow(db.Model):
+    """关注关系，target_type 为 novel 时 target_id 是小说 id，为 author 时是作者的用户 id"""
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "target_type", "target_id"),
+        db.Index("ix_follow_target", "target_type", "target_id", "user_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    target_type = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class InboxItem(db.Model):
+    """推送到用户更新收件箱的新章节，created_at 与章节的发布时间一致"""
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "chapter_id"),
+        db.Index("ix_inbox_user_feed", "user_id", "created_at", "chapter_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    chapter_id = db.Column(db.Integer, db.ForeignKey("chapter.id"), nullable=False)
+    novel_id = db.Column(db.Integer, db.ForeignKey("novel.id"), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
@@ -2,6 +2,7 @@ import os
 import sys
 
 from app import app, db
+from jobs import start_embedded_worker
 
 
 def create_super_admin():
@@ -43,5 +44,9 @@ if __name__ == "__main__":
         print("超级管理员账户: admin / admin123")
         print("=" * 50)
 
+    # 调试模式下由重载器启动的子进程负责处理后台任务
+    if app.config["JOBS_EMBEDDED_WORKER"] and os.environ.get("WERKZEUG_RUN_MAIN"):
+        start_embedded_worker(app)
+
     # 启动应用
     app.run(debug=True, host="0.0.0.0", port=5000)
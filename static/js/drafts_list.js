@@ -0,0 +1,29 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 搜索功能
+    const searchInput = document.querySelector('.search-input');
+    const draftCards = document.querySelectorAll('.draft-card');
+
+    searchInput.addEventListener('input', function() {
+        const searchTerm = this.value.toLowerCase();
+
+        draftCards.forEach(card => {
+            const title = card.querySelector('.draft-title').textContent.toLowerCase();
+            const content = card.querySelector('.draft-preview').textContent.toLowerCase();
+
+            if (title.includes(searchTerm) || content.includes(searchTerm)) {
+                card.style.display = 'block';
+            } else {
+                card.style.display = 'none';
+            }
+        });
+    });
+
+    // 点击外部关闭菜单
+    document.addEventListener('click', function(e) {
+        if (!e.target.closest('.action-menu')) {
+            document.querySelectorAll('.menu-dropdown').forEach(menu => {
+                menu.style.display = 'none';
+            });
+        }
+    });
+});
@@ -0,0 +1,83 @@
+// 小说详情页 - 通过 SSE 接收新章节和新评论，无需刷新页面
+
+document.addEventListener("DOMContentLoaded", function () {
+  const container = document.querySelector(".novel-detail-container");
+  if (!container || !window.EventSource) {
+    return;
+  }
+
+  const source = new EventSource(container.dataset.eventsUrl);
+
+  function element(tag, className, text) {
+    const node = document.createElement(tag);
+    node.className = className;
+    if (text !== undefined) {
+      node.textContent = text;
+    }
+    return node;
+  }
+
+  // 空状态提示替换为列表
+  function ensureList(section, listClass, emptyClass) {
+    let list = section.querySelector("." + listClass);
+    if (!list) {
+      list = element("div", listClass);
+      const empty = section.querySelector("." + emptyClass);
+      if (empty) {
+        empty.replaceWith(list);
+      } else {
+        section.appendChild(list);
+      }
+    }
+    return list;
+  }
+
+  function showNotice() {
+    document.getElementById("live-update-notice").hidden = false;
+  }
+
+  source.addEventListener("chapter", function (event) {
+    const data = JSON.parse(event.data);
+    const section = document.querySelector(".chapters-section");
+    const list = ensureList(section, "chapters-list", "empty-chapters");
+
+    const item = element("div", "chapter-item is-new");
+    const content = element("div", "chapter-item-content");
+    const link = element("a", "chapter-link");
+    link.href = data.url;
+    link.appendChild(
+      element("span", "chapter-number", "第" + data.chapter_number + "章"),
+    );
+    link.appendChild(element("span", "chapter-title", data.title));
+    link.appendChild(element("span", "chapter-date", data.date));
+    content.appendChild(link);
+    item.appendChild(content);
+    list.appendChild(item);
+
+    const count = section.querySelector(".chapter-count");
+    if (count) {
+      count.textContent = list.children.length + " 章";
+    }
+  });
+
+  source.addEventListener("comment", function (event) {
+    const data = JSON.parse(event.data);
+    const section = document.querySelector(".comments-section");
+    const list = ensureList(section, "comments-list", "empty-comments");
+
+    const item = element("div", "comment-item is-new");
+    const header = element("div", "comment-header");
+    header.appendChild(element("span", "comment-author", data.username));
+    header.appendChild(element("span", "comment-date", data.date));
+    item.appendChild(header);
+    item.appendChild(element("div", "comment-content", data.content));
+    list.insertBefore(item, list.firstChild);
+  });
+
+  // 连接积压过多或断线太久，错过的事件无法补发
+  source.addEventListener("resync", showNotice);
+
+  window.addEventListener("pagehide", function () {
+    source.close();
+  });
+});
@@ -0,0 +1,220 @@
+// 阅读页 - 无刷新切换章节、预取下一章并注册离线缓存
+
+document.addEventListener("DOMContentLoaded", function () {
+  const reader = document.getElementById("reader");
+  if (!reader || !window.fetch || !window.history.pushState) {
+    return;
+  }
+
+  const placeholder = reader.dataset.placeholder;
+  const novelTitle = document.querySelector(".novel-title-reading").textContent;
+  const chapters = new Map();
+  let current = parseInt(reader.dataset.chapterNumber, 10);
+  let loading = false;
+
+  // 地址模板由服务器生成，只替换其中的章节号占位符
+  function apiUrl(number) {
+    return reader.dataset.apiUrl.replace(placeholder, number);
+  }
+
+  function readUrl(number) {
+    return reader.dataset.readUrl.replace(placeholder, number);
+  }
+
+  // 同一章节的并发请求共用一个 Promise
+  function fetchChapter(number) {
+    if (!chapters.has(number)) {
+      const request = fetch(apiUrl(number), {
+        headers: { Accept: "application/json" },
+      })
+        .then(function (response) {
+          if (!response.ok) {
+            throw new Error("章节加载失败");
+          }
+          return response.json();
+        })
+        .catch(function (error) {
+          chapters.delete(number);
+          throw error;
+        });
+      chapters.set(number, request);
+    }
+    return chapters.get(number);
+  }
+
+  function prefetch(data) {
+    if (!data.next_chapter) {
+      return;
+    }
+    const number = data.next_chapter.chapter_number;
+    const idle = window.requestIdleCallback || window.setTimeout;
+    idle(function () {
+      fetchChapter(number).catch(function () {});
+    });
+  }
+
+  // 正文按纯文本处理，换行转为 <br>
+  function setText(element, text) {
+    element.textContent = "";
+    text.split("\n").forEach(function (line, index) {
+      if (index > 0) {
+        element.appendChild(document.createElement("br"));
+      }
+      element.appendChild(document.createTextNode(line));
+    });
+  }
+
+  function formatDate(iso) {
+    const date = new Date(iso);
+    const pad = function (value) {
+      return String(value).padStart(2, "0");
+    };
+    return (
+      date.getFullYear() +
+      "年" +
+      pad(date.getMonth() + 1) +
+      "月" +
+      pad(date.getDate()) +
+      "日"
+    );
+  }
+
+  function navButton(chapter, direction) {
+    const label = direction === "prev" ? "上一章" : "下一章";
+    const empty = direction === "prev" ? "已经是第一章" : "最新章节";
+    const arrow = direction === "prev" ? "←" : "→";
+
+    const button = document.createElement(chapter ? "a" : "div");
+    button.className = "nav-btn nav-" + direction + (chapter ? "" : " disabled");
+    if (chapter) {
+      button.href = readUrl(chapter.chapter_number);
+      button.dataset.chapterNumber = chapter.chapter_number;
+    }
+
+    const arrowSpan = document.createElement("span");
+    arrowSpan.className = "nav-arrow";
+    arrowSpan.textContent = arrow;
+
+    const info = document.createElement("div");
+    info.className = "nav-info";
+    const labelSpan = document.createElement("span");
+    labelSpan.className = "nav-label";
+    labelSpan.textContent = label;
+    const titleSpan = document.createElement("span");
+    titleSpan.className = "nav-title";
+    titleSpan.textContent = chapter ? chapter.title : empty;
+    info.appendChild(labelSpan);
+    info.appendChild(titleSpan);
+
+    if (direction === "prev") {
+      button.appendChild(arrowSpan);
+      button.appendChild(info);
+    } else {
+      button.appendChild(info);
+      button.appendChild(arrowSpan);
+    }
+    return button;
+  }
+
+  function render(data) {
+    const chapter = data.chapter;
+    current = chapter.chapter_number;
+    reader.dataset.chapterNumber = current;
+
+    document.getElementById("chapter-title").textContent = chapter.title;
+    document.getElementById("chapter-number").textContent =
+      "第" + chapter.chapter_number + "章";
+    document.getElementById("chapter-date").textContent = formatDate(
+      chapter.created_at,
+    );
+    setText(document.getElementById("chapter-content"), chapter.content);
+
+    const note = document.getElementById("author-note");
+    note.hidden = !chapter.author_note;
+    setText(document.getElementById("author-note-content"), chapter.author_note);
+
+    const navigation = document.getElementById("chapter-navigation");
+    navigation.replaceChild(
+      navButton(data.prev_chapter, "prev"),
+      navigation.querySelector(".nav-prev"),
+    );
+    navigation.replaceChild(
+      navButton(data.next_chapter, "next"),
+      navigation.querySelector(".nav-next"),
+    );
+
+    document.querySelectorAll(".chapter-sidebar-item").forEach(function (item) {
+      item.classList.toggle(
+        "active",
+        parseInt(item.dataset.chapterNumber, 10) === current,
+      );
+    });
+
+    document.title = chapter.title + " - " + novelTitle + " - 优雅小说";
+    window.scrollTo(0, 0);
+    prefetch(data);
+  }
+
+  function chapterNumberOf(link) {
+    return parseInt(link.dataset.chapterNumber, 10);
+  }
+
+  function open(number, push) {
+    if (loading || number === current) {
+      return Promise.resolve();
+    }
+    loading = true;
+    return fetchChapter(number)
+      .then(function (data) {
+        render(data);
+        if (push) {
+          history.pushState({ chapter: number }, "", data.url);
+        }
+      })
+      .catch(function () {
+        // 接口不可用时退回普通的页面跳转
+        window.location.href = readUrl(number);
+      })
+      .finally(function () {
+        loading = false;
+      });
+  }
+
+  document.addEventListener("click", function (event) {
+    if (event.defaultPrevented || event.button !== 0) {
+      return;
+    }
+    if (event.metaKey || event.ctrlKey || event.shiftKey || event.altKey) {
+      return;
+    }
+    const link = event.target.closest(
+      "a.nav-prev, a.nav-next, a.chapter-sidebar-item",
+    );
+    if (!link || !reader.contains(link)) {
+      return;
+    }
+    const number = chapterNumberOf(link);
+    if (!isNaN(number)) {
+      event.preventDefault();
+      open(number, true);
+    }
+  });
+
+  window.addEventListener("popstate", function (event) {
+    if (event.state && event.state.chapter) {
+      open(event.state.chapter, false);
+    }
+  });
+
+  history.replaceState({ chapter: current }, "", window.location.href);
+
+  // 预取当前章节的下一章
+  const nextLink = reader.querySelector("a.nav-next");
+  if (nextLink) {
+    prefetch({ next_chapter: { chapter_number: chapterNumberOf(nextLink) } });
+  }
+
+  if ("serviceWorker" in navigator) {
+    navigator.serviceWorker.register(reader.dataset.swUrl).catch(function () {});
+  }
+});
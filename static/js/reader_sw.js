@@ -0,0 +1,96 @@
+// 阅读页 Service Worker - 缓存读过的章节，离线时也能继续阅读
+
+const CACHE_NAME = "reader-v2";
+const MAX_CHAPTERS = 200;
+const CHAPTER_API = /\/api\/v1\/novels\/\d+\/chapters\/\d+$/;
+const READ_PAGE = /\/read\/\d+\/\d+$/;
+
+self.addEventListener("install", function () {
+  self.skipWaiting();
+});
+
+self.addEventListener("activate", function (event) {
+  event.waitUntil(
+    caches
+      .keys()
+      .then(function (names) {
+        return Promise.all(
+          names
+            .filter(function (name) {
+              return name.startsWith("reader-") && name !== CACHE_NAME;
+            })
+            .map(function (name) {
+              return caches.delete(name);
+            }),
+        );
+      })
+      .then(function () {
+        return self.clients.claim();
+      }),
+  );
+});
+
+// 超过上限时删除最早缓存的条目
+function trimCache(cache) {
+  return cache.keys().then(function (keys) {
+    const excess = keys.length - MAX_CHAPTERS;
+    return Promise.all(
+      keys.slice(0, Math.max(excess, 0)).map(function (key) {
+        return cache.delete(key);
+      }),
+    );
+  });
+}
+
+function store(request, response) {
+  if (!response.ok) {
+    return;
+  }
+  const copy = response.clone();
+  caches.open(CACHE_NAME).then(function (cache) {
+    cache.put(request, copy).then(function () {
+      trimCache(cache);
+    });
+  });
+}
+
+// 章节接口：先返回缓存，同时在后台用网络更新缓存
+function staleWhileRevalidate(event) {
+  const network = fetch(event.request).then(function (response) {
+    store(event.request, response);
+    return response;
+  });
+  event.waitUntil(network.catch(function () {}));
+  return caches.match(event.request).then(function (cached) {
+    return cached || network;
+  });
+}
+
+// 阅读页：优先请求网络，离线时使用缓存
+function networkFirst(event) {
+  return fetch(event.request)
+    .then(function (response) {
+      store(event.request, response);
+      return response;
+    })
+    .catch(function () {
+      return caches.match(event.request).then(function (cached) {
+        return cached || Response.error();
+      });
+    });
+}
+
+self.addEventListener("fetch", function (event) {
+  if (event.request.method !== "GET") {
+    return;
+  }
+  const url = new URL(event.request.url);
+  if (url.origin !== self.location.origin) {
+    return;
+  }
+  if (CHAPTER_API.test(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event));
+  } else if (READ_PAGE.test(url.pathname)) {
+    event.respondWith(networkFirst(event));
+  }
+});
@@ -0,0 +1,201 @@
+"""后台任务处理函数
+
+由 jobs.work() 在工作进程中导入并注册，每个任务在独立的应用上下文中执行。
+任务可能被重试，处理函数需要保证重复执行的结果一致。
+
+入队时使用的 (payload, idempotency key) 也在这里生成，网页请求和 reconcile()
+使用相同的 key，同一个任务只会保存一次。
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+import deletion
+import feed
+from covers import CoverError, covers
+from jobs import job_queue, task
+from models import Chapter, Novel, User, db
+
+
+# 任务的 payload 和 idempotency key
+def purge_novel_job(novel_id, created_at):
+    # 带上创建时间，id 被复用后新小说的删除任务不会与旧任务冲突
+    return {"novel_id": novel_id}, f"purge_novel:{novel_id}:{created_at.timestamp()}"
+
+
+def purge_user_job(user_id, created_at):
+    return {"user_id": user_id}, f"purge_user:{user_id}:{created_at.timestamp()}"
+
+
+def fanout_job(chapter_id, created_at):
+    return (
+        {"chapter_id": chapter_id},
+        f"fanout_chapter:{chapter_id}:{created_at.timestamp()}",
+    )
+
+
+def process_cover_job(digest):
+    return {"digest": digest}, f"process_cover:{digest}"
+
+
+def import_cover_job(novel_id, url):
+    # 同一小说的同一地址只尝试转存一次，下载失败后可以用 covers.py --backfill 重新转存
+    url_hash = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return {"novel_id": novel_id, "url": url}, f"import_cover:{novel_id}:{url_hash}"
+
+
+def reconcile(window):
+    """按业务数据重新加入可能丢失的任务，返回新加入的任务数
+
+    业务数据和任务在两个数据库中，提交业务数据之后、任务入队之前进程退出会丢失任务。
+    仍标记为删除中的小说和用户、最近 window 秒内发布的章节和修改过封面的小说都会
+    重新入队，已有的任务按 key 跳过；处理函数可以重复执行，多入队一次也没有影响。
+    已失败的任务不会重置，需要在管理后台手动重试。
+    """
+    since = datetime.utcnow() - timedelta(seconds=window)
+
+    users = db.session.execute(
+        select(User.id, User.created_at).where(User.role == "deleting")
+    ).all()
+    added = job_queue.enqueue_many(
+        "purge_user", [purge_user_job(*user) for user in users]
+    )
+
+    # 作者正在删除的小说由 purge_user 一起删除
+    novels = db.session.execute(
+        select(Novel.id, Novel.created_at).where(
+            Novel.status == "deleting",
+            Novel.author_id.not_in(select(User.id).where(User.role == "deleting")),
+        )
+    ).all()
+    added += job_queue.enqueue_many(
+        "purge_novel", [purge_novel_job(*novel) for novel in novels]
+    )
+
+    chapters = db.session.execute(
+        select(Chapter.id, Chapter.created_at)
+        .join(Novel, Novel.id == Chapter.novel_id)
+        .where(Chapter.created_at >= since, Novel.status != "deleting")
+    ).all()
+    added += job_queue.enqueue_many(
+        "fanout_chapter", [fanout_job(*chapter) for chapter in chapters]
+    )
+
+    if covers.enabled:
+        recent = db.session.execute(
+            select(Novel.id, Novel.cover_image, Novel.cover_hash).where(
+                Novel.updated_at >= since, Novel.status != "deleting"
+            )
+        ).all()
+        added += job_queue.enqueue_many(
+            "process_cover",
+            [
+                process_cover_job(novel.cover_hash)
+                for novel in recent
+                if novel.cover_hash and not covers.is_ready(novel.cover_hash)
+            ],
+        )
+        added += job_queue.enqueue_many(
+            "import_cover",
+            [
+                import_cover_job(novel.id, novel.cover_image)
+                for novel in recent
+                if not novel.cover_hash and novel.cover_image
+            ],
+        )
+    return added
+
+
+def _progress_reporter(job):
+    """把分批删除的进度累加后写入任务记录"""
+    totals = {}
+
+    def report(table, count):
+        if table == "vacuum_pages":
+            totals[table] = count
+        else:
+            totals[table] = totals.get(table, 0) + count
+        job.report_progress(**totals)
+
+    return report
+
+
+@task("purge_novel")
+def purge_novel(job, novel_id):
+    """分批删除已标记为删除中的小说及其章节、评论、草稿和审核记录"""
+    novel = Novel.query.get(novel_id)
+    if novel is None or novel.status != "deleting":
+        # 小说已删除、被恢复或 id 被复用，不做任何删除
+        return
+
+    report = _progress_reporter(job)
+    deletion.delete_novel(novel_id, report)
+    deletion.vacuum_incrementally(report)
+
+
+@task("purge_user")
+def purge_user(job, user_id):
+    """分批删除已标记为删除中的用户及其作品、评论、草稿和设置"""
+    user = User.query.get(user_id)
+    if user is None or user.role != "deleting":
+        return
+
+    report = _progress_reporter(job)
+    deletion.delete_user(user_id, report)
+    deletion.vacuum_incrementally(report)
+
+
+@task("fanout_chapter")
+def fanout_chapter(job, chapter_id):
+    """把新章节写入关注者的更新收件箱"""
+    chapter = db.session.execute(
+        select(Chapter.id, Chapter.novel_id, Chapter.created_at).where(
+            Chapter.id == chapter_id
+        )
+    ).first()
+    if chapter is None:
+        return
+    novel = Novel.query.get(chapter.novel_id)
+    if novel is None or novel.status == "deleting":
+        return
+
+    def report(count):
+        job.report_progress(inbox=count)
+
+    feed.fan_out_chapter(chapter, novel, report)
+
+
+def _render_cover(digest):
+    error = covers.process([digest]).get(digest)
+    if isinstance(error, Exception):
+        raise error
+
+
+@task("process_cover")
+def process_cover(job, digest):
+    """为上传的封面生成各尺寸的 WebP 和 JPEG"""
+    _render_cover(digest)
+
+
+@task("import_cover")
+def import_cover(job, novel_id, url):
+    """下载 URL 封面并转存到本地"""
+    novel = Novel.query.get(novel_id)
+    if novel is None or novel.cover_image != url or novel.cover_hash:
+        return
+
+    try:
+        digest = covers.store(covers.download(url))
+    except CoverError as e:
+        # 下载失败或图片无效时继续使用原地址显示，之后可用 covers.py --backfill 重新转存
+        job.report_progress(error=str(e))
+        return
+    _render_cover(digest)
+
+    Novel.query.filter_by(id=novel_id, cover_image=url).update(
+        {"cover_hash": digest, "updated_at": Novel.updated_at},
+        synchronize_session=False,
+    )
+    db.session.commit()
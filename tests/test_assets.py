@@ -0,0 +1,93 @@
+import gzip
+import json
+
+import pytest
+
+from assets import build, minify_css, minify_js
+
+
+# CSS
+def test_minify_css_removes_comments_and_whitespace():
+    source = "/* 注释 */\n.x > .y ,\n.z {\n    margin: 0 ;\n    color: red;\n}\n"
+    assert minify_css(source) == ".x>.y,.z{margin:0;color:red}\n"
+
+
+def test_minify_css_keeps_strings():
+    source = 'a::after { content: "  /* x */ ; "; }\n'
+    assert minify_css(source) == 'a::after{content:"  /* x */ ; "}\n'
+
+
+def test_minify_css_keeps_descendant_pseudo_selector():
+    assert minify_css("a :hover { color: red; }") == "a :hover{color:red}\n"
+
+
+# JS
+def test_minify_js_removes_comments_and_indentation():
+    source = "// 开头\nif (x) {\n    /* 块注释 */\n    y = 1; // 结尾\n}\n"
+    assert minify_js(source) == "if(x){\ny=1;\n}\n"
+
+
+def test_minify_js_keeps_strings_and_template_literals():
+    source = 'const s = "a // b";\nlet t = `x ${ y }  /* z */`;\nlet u = \'c\\\' d\';'
+    assert minify_js(source) == (
+        'const s="a // b";\nlet t=`x ${ y }  /* z */`;\nlet u=\'c\\\' d\';\n'
+    )
+
+
+def test_minify_js_keeps_newlines_for_semicolon_insertion():
+    assert minify_js("x = a\n(b)\n") == "x=a\n(b)\n"
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("var r = /[/]\\//g.test(x);", "var r=/[/]\\//g.test(x);\n"),
+        ("return /a  b/.test(s)", "return /a  b/.test(s)\n"),
+        ("f(x, /a  b/)", "f(x,/a  b/)\n"),
+    ],
+)
+def test_minify_js_keeps_regex_literals(source, expected):
+    assert minify_js(source) == expected
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("x = a / b / c", "x=a / b / c\n"),
+        ("x = (a) / 2 / (b)", "x=(a)/ 2 /(b)\n"),
+        ('x = "a" / 2 // 注释', 'x="a" / 2\n'),
+    ],
+)
+def test_minify_js_treats_slash_after_operand_as_division(source, expected):
+    assert minify_js(source) == expected
+
+
+# 构建
+def test_build_writes_hashed_files_and_manifest(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "js").mkdir()
+    (tmp_path / "css" / "style.css").write_text("body {\n  margin: 0;\n}\n")
+    (tmp_path / "js" / "app.js").write_text("// app\nlet x = 1;\n")
+    (tmp_path / "js" / "reader_sw.js").write_text("self.x = 1;\n")
+    (tmp_path / "js" / "notes.txt").write_text("不参与构建\n")
+
+    report = build(str(tmp_path))
+    dist = tmp_path / "dist"
+    manifest = json.loads((dist / "manifest.json").read_text())
+    assert sorted(manifest) == ["css/style.css", "js/app.js"]
+    assert [row[0] for row in report] == ["css/style.css", "js/app.js"]
+
+    target = manifest["css/style.css"]
+    assert target.startswith("css/style.") and target.endswith(".css")
+    assert (dist / target).read_text() == "body{margin:0}\n"
+    assert gzip.decompress((dist / (target + ".gz")).read_bytes()) == (
+        b"body{margin:0}\n"
+    )
+
+    # 内容不变时文件名不变，修改后生成新文件名
+    assert build(str(tmp_path)) == report
+    (tmp_path / "css" / "style.css").write_text("body { margin: 1px; }\n")
+    build(str(tmp_path), clean=True)
+    manifest = json.loads((dist / "manifest.json").read_text())
+    assert manifest["css/style.css"] != target
+    assert not (dist / target).exists()
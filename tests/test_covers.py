@@ -0,0 +1,85 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from covers import CoverError, Covers
+
+PUBLIC_IP = "93.184.216.34"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hosts.append(self.headers["Host"])
+        self.send_response(200)
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"cover")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    server.hosts = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def fake_dns(monkeypatch, *answers):
+    """依次返回给定的地址，最后一个地址之后一直返回它"""
+    answers = list(answers)
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        ip = answers.pop(0) if len(answers) > 1 else answers[0]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (ip, port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+
+
+def test_download_connects_to_the_checked_address(server, monkeypatch):
+    fake_dns(monkeypatch, PUBLIC_IP)
+    connected = []
+
+    def create_connection(address, *args, **kwargs):
+        connected.append(address)
+        # 解析已被替换，这里直接连接本地测试服务器
+        sock = socket.socket()
+        sock.connect(server.server_address)
+        return sock
+
+    monkeypatch.setattr(socket, "create_connection", create_connection)
+    port = server.server_address[1]
+
+    data = Covers().download(f"http://covers.example:{port}/a.png")
+
+    assert data == b"cover"
+    assert connected == [(PUBLIC_IP, port)]
+    assert server.hosts == [f"covers.example:{port}"]
+
+
+def test_download_rejects_rebinding_to_private_address(server, monkeypatch):
+    fake_dns(monkeypatch, PUBLIC_IP, "127.0.0.1")
+    port = server.server_address[1]
+
+    with pytest.raises(CoverError, match="内网"):
+        Covers().download(f"http://covers.example:{port}/a.png")
+    assert server.hosts == []
+
+
+def test_check_public_url_rejects_private_addresses(monkeypatch):
+    fake_dns(monkeypatch, "10.0.0.1")
+    with pytest.raises(CoverError, match="内网"):
+        Covers().download("https://covers.example/a.png")
+
+
+@pytest.mark.parametrize("url", ["ftp://covers.example/a.png", "http:///a.png"])
+def test_check_public_url_rejects_other_schemes(url):
+    with pytest.raises(CoverError, match="http"):
+        Covers().download(url)
@@ -0,0 +1,199 @@
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+import deletion
+from models import (
+    Chapter,
+    Comment,
+    Draft,
+    Follow,
+    InboxItem,
+    Message,
+    Novel,
+    User,
+    UserSettings,
+    db,
+)
+
+
+def make_app(uri):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=uri,
+        DELETE_BATCH_SIZE=2,
+        DELETE_BATCH_PAUSE=0,
+        DELETE_VACUUM_PAGES=10,
+    )
+    db.init_app(app)
+    return app
+
+
+@pytest.fixture
+def app():
+    app = make_app("sqlite://")
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def add_user(name):
+    user = User(username=name, email=f"{name}@example.com")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_novel(author, chapters=0, content="正文"):
+    novel = Novel(title="小说", author_id=author.id)
+    db.session.add(novel)
+    db.session.commit()
+    for number in range(1, chapters + 1):
+        db.session.add(
+            Chapter(
+                title=f"第{number}章",
+                content=content,
+                chapter_number=number,
+                novel_id=novel.id,
+            )
+        )
+    db.session.commit()
+    return novel
+
+
+def count(model, **filters):
+    return model.query.filter_by(**filters).count()
+
+
+# 分批删除
+def test_delete_in_batches_commits_each_batch(app):
+    novel = add_novel(add_user("author"), chapters=5)
+    batches = []
+
+    total = deletion.delete_in_batches(
+        Chapter,
+        Chapter.novel_id == novel.id,
+        lambda table, deleted: batches.append((table, deleted)),
+    )
+    assert total == 5
+    assert batches == [("chapter", 2), ("chapter", 2), ("chapter", 1)]
+    assert count(Chapter) == 0
+
+
+def test_interrupted_delete_resumes_from_remaining_rows(app):
+    author = add_user("author")
+    novel = add_novel(author, chapters=5)
+
+    def crash(table, deleted):
+        raise RuntimeError("进程退出")
+
+    with pytest.raises(RuntimeError):
+        deletion.delete_novel(novel.id, crash)
+    # 已提交的批次不会回滚
+    assert count(Chapter) == 3
+    assert count(Novel) == 1
+
+    counts = deletion.delete_novel(novel.id)
+    assert counts["chapter"] == 3
+    assert counts["novel"] == 1
+    assert count(Chapter) == count(Novel) == 0
+
+
+# 级联删除
+def test_delete_novel_only_touches_that_novel(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    novel = add_novel(author, chapters=3)
+    other = add_novel(author, chapters=2)
+    chapter = Chapter.query.filter_by(novel_id=novel.id).first()
+    db.session.add_all(
+        [
+            Comment(content="好看", user_id=reader.id, novel_id=novel.id),
+            Comment(content="好看", user_id=reader.id, novel_id=other.id),
+            Draft(novel_id=novel.id, user_id=author.id),
+            Follow(user_id=reader.id, target_type="novel", target_id=novel.id),
+            Follow(user_id=reader.id, target_type="novel", target_id=other.id),
+            Follow(user_id=reader.id, target_type="author", target_id=author.id),
+            InboxItem(
+                user_id=reader.id,
+                chapter_id=chapter.id,
+                novel_id=novel.id,
+                created_at=chapter.created_at,
+            ),
+        ]
+    )
+    db.session.commit()
+    novel_id = novel.id
+
+    counts = deletion.delete_novel(novel_id)
+    assert counts == {
+        "inbox_item": 1,
+        "moderation_review": 0,
+        "comment": 1,
+        "draft": 1,
+        "chapter": 3,
+        "follow": 1,
+        "novel": 1,
+    }
+    assert count(Chapter, novel_id=other.id) == 2
+    assert count(Comment, novel_id=other.id) == 1
+    assert count(Follow) == 2
+
+
+def test_delete_user_removes_works_and_own_rows(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    novel = add_novel(author, chapters=2)
+    other = add_novel(reader, chapters=1)
+    db.session.add_all(
+        [
+            Comment(content="作者的评论", user_id=author.id, novel_id=other.id),
+            Comment(content="读者的评论", user_id=reader.id, novel_id=other.id),
+            Message(content="留言", user_id=author.id),
+            UserSettings(user_id=author.id, nickname="笔名"),
+            Follow(user_id=author.id, target_type="novel", target_id=other.id),
+            Follow(user_id=reader.id, target_type="author", target_id=author.id),
+        ]
+    )
+    db.session.commit()
+    author_id, novel_id = author.id, novel.id
+
+    counts = deletion.delete_user(author_id)
+    assert counts["novel"] == 1
+    assert counts["chapter"] == 2
+    assert counts["comment"] == 1
+    assert counts["follow"] == 2
+    assert counts["user"] == 1
+    assert db.session.get(Novel, novel_id) is None
+    assert db.session.get(User, author_id) is None
+    assert count(Message) == count(UserSettings) == count(Follow) == 0
+    # 其他用户的作品和评论保持不变
+    assert count(Chapter, novel_id=other.id) == 1
+    assert count(Comment) == 1
+
+
+# 回收空闲页
+def test_vacuum_skips_databases_without_incremental_mode(app):
+    assert deletion.vacuum_incrementally() == 0
+
+
+def test_vacuum_reclaims_free_pages_in_steps(tmp_path):
+    app = make_app(f"sqlite:///{tmp_path / 'novel.db'}")
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        db.create_all()
+        novel = add_novel(add_user("author"), chapters=40, content="字" * 4000)
+        deletion.delete_novel(novel.id)
+
+        free = db.session.execute(text("PRAGMA freelist_count")).scalar()
+        assert free > 20
+        steps = []
+        reclaimed = deletion.vacuum_incrementally(
+            lambda name, total: steps.append(total)
+        )
+        assert reclaimed == free
+        assert steps == [min(pages, free) for pages in range(10, free + 10, 10)]
+        assert db.session.execute(text("PRAGMA freelist_count")).scalar() == 0
+        db.session.remove()
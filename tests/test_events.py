@@ -0,0 +1,129 @@
+import json
+import time
+
+import pytest
+
+from events import HEARTBEAT, RESYNC, EventHub, format_event
+
+
+@pytest.fixture
+def hub():
+    hub = EventHub()
+    hub.queue_size = 5
+    hub.history_size = 4
+    hub.heartbeat_seconds = 0.01
+    return hub
+
+
+def receive(subscriber, count, timeout=2):
+    """等待分发线程送达 count 条消息"""
+    frames = []
+    deadline = time.monotonic() + timeout
+    while len(frames) < count and time.monotonic() < deadline:
+        frames.extend(subscriber.wait(0.05))
+    return frames
+
+
+def event_ids(frames):
+    return [frame.split("\n", 1)[0][len("id: "):] for frame in frames]
+
+
+def payloads(frames):
+    return [json.loads(frame.rsplit("data: ", 1)[1]) for frame in frames]
+
+
+def test_format_event():
+    frame = format_event("chapter", {"title": "第一章"}, "abc-1")
+    assert frame == 'id: abc-1\nevent: chapter\ndata: {"title": "第一章"}\n\n'
+    assert format_event("resync", {}) == "event: resync\ndata: {}\n\n"
+
+
+def test_publish_fans_out_to_topic_subscribers(hub):
+    first = hub.subscribe("novel:1")
+    second = hub.subscribe("novel:1")
+    other = hub.subscribe("novel:2")
+
+    hub.publish("novel:1", "comment", {"n": 1})
+    hub.publish("novel:1", "comment", {"n": 2})
+    frames = receive(first, 2)
+    assert payloads(frames) == [{"n": 1}, {"n": 2}]
+    assert event_ids(frames) == [f"{hub.instance}-1", f"{hub.instance}-2"]
+    # 所有订阅者共享同一个格式化后的字符串
+    assert all(a is b for a, b in zip(frames, receive(second, 2)))
+    assert other.wait(0) == []
+
+
+def test_unsubscribe(hub):
+    subscriber = hub.subscribe("novel:1")
+    assert hub.subscriber_count == 1
+    hub.unsubscribe(subscriber)
+    hub.unsubscribe(subscriber)
+    assert hub.subscriber_count == 0
+
+    hub.publish("novel:1", "comment", {})
+    assert receive(hub.subscribe("novel:1", f"{hub.instance}-0"), 1)
+    assert subscriber.wait(0) == []
+
+
+# 断线重连
+def test_last_event_id_replays_missed_events(hub):
+    subscriber = hub.subscribe("novel:1")
+    for n in range(3):
+        hub.publish("novel:1", "chapter", {"n": n})
+    first_id = event_ids(receive(subscriber, 3))[0]
+
+    resumed = hub.subscribe("novel:1", first_id)
+    assert payloads(resumed.wait(0)) == [{"n": 1}, {"n": 2}]
+
+
+@pytest.mark.parametrize("last_event_id", ["other-1", "bad", "{instance}-x"])
+def test_unknown_last_event_id_resyncs(hub, last_event_id):
+    subscriber = hub.subscribe(
+        "novel:1", last_event_id.format(instance=hub.instance)
+    )
+    assert subscriber.wait(0) == [RESYNC]
+
+
+def test_last_event_id_older_than_history_resyncs(hub):
+    subscriber = hub.subscribe("novel:1")
+    for n in range(6):
+        hub.publish("novel:1", "chapter", {"n": n})
+        receive(subscriber, 1)
+
+    # 只保留了最近 4 条，第 2 条之后的事件已经无法补齐
+    assert hub.subscribe("novel:1", f"{hub.instance}-1").wait(0) == [RESYNC]
+    resumed = hub.subscribe("novel:1", f"{hub.instance}-2")
+    assert payloads(resumed.wait(0)) == [{"n": n} for n in range(2, 6)]
+
+
+# 消费过慢
+def test_overflow_drops_backlog_and_resyncs(hub):
+    slow = hub.subscribe("novel:1")
+    fast = hub.subscribe("novel:1")
+    for n in range(6):
+        hub.publish("novel:1", "comment", {"n": n})
+        # 及时读取的订阅者不受影响
+        assert payloads(receive(fast, 1)) == [{"n": n}]
+
+    assert slow.wait(0) == [RESYNC]
+    hub.publish("novel:1", "comment", {"n": 6})
+    assert payloads(receive(slow, 1)) == [{"n": 6}]
+
+
+def test_stream_sends_retry_and_heartbeat(hub):
+    stream = hub.stream("novel:1")
+    assert next(stream) == f"retry: {hub.retry_ms}\n\n"
+    assert next(stream) == HEARTBEAT
+    assert hub.subscriber_count == 1
+
+    hub.publish("novel:1", "comment", {"n": 1})
+    frames = []
+    deadline = time.monotonic() + 2
+    while not frames and time.monotonic() < deadline:
+        frame = next(stream)
+        if frame != HEARTBEAT:
+            frames.append(frame)
+    assert payloads(frames) == [{"n": 1}]
+
+    stream.close()
+    assert hub.subscriber_count == 0
@@ -0,0 +1,248 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from feed import (
+    AUTHOR,
+    NOVEL,
+    decode_cursor,
+    encode_cursor,
+    fan_out_chapter,
+    load_feed,
+    toggle_follow,
+)
+from models import Chapter, Follow, InboxItem, Novel, User, db
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+        FEED_FANOUT_THRESHOLD=3,
+        FEED_FANOUT_BATCH_SIZE=2,
+        FEED_PAGE_SIZE=2,
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def add_user(name):
+    user = User(username=name, email=f"{name}@example.com")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_novel(author, title="小说"):
+    novel = Novel(title=title, author_id=author.id)
+    db.session.add(novel)
+    db.session.commit()
+    return novel
+
+
+def add_chapter(novel, number, minutes=None):
+    chapter = Chapter(
+        title=f"第{number}章",
+        content="正文",
+        chapter_number=number,
+        novel_id=novel.id,
+        created_at=START + timedelta(minutes=number if minutes is None else minutes),
+    )
+    db.session.add(chapter)
+    db.session.commit()
+    return chapter
+
+
+def follow(user, target_type, target_id, at=START):
+    toggle_follow(user.id, target_type, target_id)
+    Follow.query.filter_by(
+        user_id=user.id, target_type=target_type, target_id=target_id
+    ).update({"created_at": at})
+    db.session.commit()
+
+
+def unfollow(user, target_type, target_id):
+    assert not toggle_follow(user.id, target_type, target_id)
+    db.session.commit()
+
+
+def feed_ids(user_id, cursor=None):
+    items, next_cursor = load_feed(user_id, cursor)
+    return [item.id for item in items], next_cursor
+
+
+# 游标
+def test_cursor_round_trip():
+    stamp = datetime(2024, 5, 6, 7, 8, 9, 123456)
+    assert decode_cursor(encode_cursor(stamp, 42)) == (stamp, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "2024-01-01T00:00:00", "bad_1", "_1"])
+def test_invalid_cursor_decodes_to_none(cursor):
+    assert decode_cursor(cursor) is None
+
+
+# 关注
+def test_toggle_follow(app):
+    reader = add_user("reader")
+    follow(reader, NOVEL, 1)
+    assert not toggle_follow(reader.id, NOVEL, 1)
+    assert toggle_follow(reader.id, NOVEL, 1)
+
+
+# 写扩散
+def test_fan_out_writes_each_follower_once(app):
+    author = add_user("author")
+    novel = add_novel(author)
+    readers = [add_user(f"reader{i}") for i in range(3)]
+    # 同时关注小说和作者的用户只写一次
+    follow(readers[0], NOVEL, novel.id)
+    follow(readers[0], AUTHOR, author.id)
+    follow(readers[1], NOVEL, novel.id)
+    follow(readers[2], AUTHOR, author.id)
+    chapter = add_chapter(novel, 1)
+
+    progress = []
+    assert fan_out_chapter(chapter, novel, progress.append) == 3
+    assert progress == [2, 3]
+    # 重复执行不产生重复记录
+    fan_out_chapter(chapter, novel)
+    assert InboxItem.query.count() == 3
+    assert feed_ids(readers[2].id) == ([chapter.id], None)
+
+
+def test_fan_out_over_threshold_switches_to_read(app):
+    author = add_user("author")
+    novel = add_novel(author)
+    readers = [add_user(f"reader{i}") for i in range(4)]
+    for reader in readers:
+        follow(reader, NOVEL, novel.id)
+    chapter = add_chapter(novel, 1)
+
+    assert fan_out_chapter(chapter, novel) == 0
+    db.session.refresh(novel)
+    assert novel.fanout_on_read
+    assert InboxItem.query.count() == 0
+    assert feed_ids(readers[0].id) == ([chapter.id], None)
+
+
+# 读取更新流
+def test_load_feed_pages_through_inbox(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    novel = add_novel(author)
+    follow(reader, NOVEL, novel.id)
+    chapters = [add_chapter(novel, number) for number in range(1, 6)]
+    for chapter in chapters:
+        fan_out_chapter(chapter, novel)
+
+    seen = []
+    cursor = None
+    while True:
+        ids, cursor = feed_ids(reader.id, cursor)
+        assert len(ids) <= 2
+        seen.extend(ids)
+        if cursor is None:
+            break
+    assert seen == [chapter.id for chapter in reversed(chapters)]
+
+
+def test_load_feed_merges_inbox_and_hot_novels(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    quiet = add_novel(author, "冷门")
+    hot = add_novel(add_user("other"), "热门")
+    follow(reader, NOVEL, quiet.id)
+    follow(reader, NOVEL, hot.id)
+
+    # 标记为读扩散之前写入收件箱的章节不应重复出现
+    early = add_chapter(hot, 1, minutes=1)
+    fan_out_chapter(early, hot)
+    hot.fanout_on_read = True
+    db.session.commit()
+
+    quiet_chapters = [add_chapter(quiet, n, minutes=m) for n, m in ((1, 2), (2, 4))]
+    for chapter in quiet_chapters:
+        fan_out_chapter(chapter, quiet)
+    late = add_chapter(hot, 2, minutes=3)
+    # 同一时间发布的章节按 id 排序
+    tied = add_chapter(hot, 3, minutes=4)
+
+    first, cursor = feed_ids(reader.id)
+    second, cursor = feed_ids(reader.id, cursor)
+    third, cursor = feed_ids(reader.id, cursor)
+    assert first == [tied.id, quiet_chapters[1].id]
+    assert second == [late.id, quiet_chapters[0].id]
+    assert third == [early.id]
+    assert cursor is None
+
+
+def test_hot_novels_only_show_chapters_after_the_follow(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    novel = add_novel(author)
+    novel.fanout_on_read = True
+    db.session.commit()
+    earlier = add_chapter(novel, 1, minutes=1)
+    later = add_chapter(novel, 2, minutes=3)
+    follow(reader, NOVEL, novel.id, at=START + timedelta(minutes=2))
+
+    assert feed_ids(reader.id) == ([later.id], None)
+
+    # 更早关注了作者时，以最早的关注时间为准
+    follow(reader, AUTHOR, author.id)
+    assert feed_ids(reader.id)[0] == [later.id, earlier.id]
+
+
+# 取消关注
+def test_unfollow_drops_inbox_items(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    novel = add_novel(author)
+    follow(reader, NOVEL, novel.id)
+    fan_out_chapter(add_chapter(novel, 1), novel)
+
+    unfollow(reader, NOVEL, novel.id)
+    assert InboxItem.query.count() == 0
+    assert feed_ids(reader.id) == ([], None)
+
+
+def test_unfollow_keeps_items_covered_by_another_follow(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    followed = add_novel(author, "单独关注")
+    other = add_novel(author, "其他作品")
+    follow(reader, NOVEL, followed.id)
+    follow(reader, AUTHOR, author.id)
+    first = add_chapter(followed, 1)
+    second = add_chapter(other, 1, minutes=2)
+    fan_out_chapter(first, followed)
+    fan_out_chapter(second, other)
+
+    # 仍关注作者，取消关注单本小说不影响更新流
+    unfollow(reader, NOVEL, followed.id)
+    assert feed_ids(reader.id)[0] == [second.id, first.id]
+
+    follow(reader, NOVEL, followed.id)
+    # 取消关注作者后只保留单独关注的小说
+    unfollow(reader, AUTHOR, author.id)
+    assert feed_ids(reader.id) == ([first.id], None)
+
+
+def test_load_feed_skips_deleting_novels(app):
+    author = add_user("author")
+    reader = add_user("reader")
+    novel = add_novel(author)
+    follow(reader, AUTHOR, author.id)
+    fan_out_chapter(add_chapter(novel, 1), novel)
+
+    novel.status = "deleting"
+    db.session.commit()
+    assert feed_ids(reader.id) == ([], None)
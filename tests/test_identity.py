@@ -0,0 +1,190 @@
+from datetime import datetime
+
+import pytest
+from flask import Flask, session
+
+import identity
+from identity import (
+    TTLCache,
+    can_manage_novel,
+    current_identity,
+    identity_cache,
+    user_created,
+)
+from models import Novel, User, UserSettings, db
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(identity.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def app(clock):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY="test",
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+        IDENTITY_CACHE_TTL=60,
+    )
+    db.init_app(app)
+    identity_cache.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def add_user(name, role="reader", created_at=None):
+    user = User(
+        username=name,
+        email=f"{name}@example.com",
+        role=role,
+        created_at=created_at or datetime(2024, 1, 1),
+    )
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def identity_for(app, user, created=None):
+    """模拟一个已登录的新请求"""
+    # g 属于应用上下文，每个请求推入新的应用上下文
+    with app.app_context(), app.test_request_context():
+        session["user_id"] = user.id
+        if created is not None:
+            session["user_created"] = created
+        return current_identity()
+
+
+# TTLCache
+def test_ttl_cache_reloads_after_expiry(clock):
+    cache = TTLCache(ttl=10, max_size=10)
+    loads = []
+
+    def load():
+        loads.append(clock.now)
+        return len(loads)
+
+    assert cache.get("a", load) == 1
+    clock.now += 9
+    assert cache.get("a", load) == 1
+    clock.now += 1
+    assert cache.get("a", load) == 2
+    cache.pop("a")
+    assert cache.get("a", load) == 3
+
+
+def test_ttl_cache_evicts_oldest_entries(clock):
+    cache = TTLCache(ttl=10, max_size=2)
+    for key in "abc":
+        cache.get(key, lambda: key)
+    assert cache.get("a", lambda: "reloaded") == "reloaded"
+    assert cache.get("c", lambda: "reloaded") == "c"
+
+
+# 身份缓存
+def test_user_identity_is_cached_until_invalidated(app, clock):
+    user = add_user("reader")
+    assert identity_cache.user(user.id).role == "reader"
+
+    user.role = "admin"
+    db.session.commit()
+    assert identity_cache.user(user.id).role == "reader"
+    identity_cache.invalidate_user(user.id)
+    assert identity_cache.user(user.id).role == "admin"
+
+    user.role = "reader"
+    db.session.commit()
+    clock.now += 60
+    assert identity_cache.user(user.id).role == "reader"
+
+
+def test_deleting_or_missing_user_has_no_identity(app):
+    user = add_user("reader", role="deleting")
+    assert identity_cache.user(user.id) is None
+    assert identity_cache.user(user.id + 1) is None
+
+
+def test_settings_are_returned_as_copies(app):
+    user = add_user("author")
+    assert identity_cache.settings(user.id) is None
+    identity_cache.invalidate_settings(user.id)
+
+    db.session.add(UserSettings(user_id=user.id, nickname="笔名"))
+    db.session.commit()
+    settings = identity_cache.settings(user.id)
+    settings["nickname"] = "改过"
+    assert identity_cache.settings(user.id)["nickname"] == "笔名"
+
+
+def test_current_identity_is_loaded_once_per_request(app):
+    user = add_user("reader")
+    with app.app_context(), app.test_request_context():
+        assert current_identity() is None
+    with app.app_context(), app.test_request_context():
+        session["user_id"] = user.id
+        first = current_identity()
+        identity_cache.invalidate_user(user.id)
+        assert current_identity() is first
+
+
+def test_can_manage_novel_checks_the_loaded_novel(app):
+    author = add_user("author")
+    admin = add_user("admin", role="admin")
+    reader = add_user("reader")
+    novel = Novel(title="小说", author_id=author.id)
+    db.session.add(novel)
+    db.session.commit()
+
+    def can_manage(user, **kwargs):
+        with app.app_context(), app.test_request_context():
+            session["user_id"] = user.id
+            return can_manage_novel(novel, **kwargs)
+
+    assert can_manage(author, allow_admin=False)
+    assert can_manage(admin)
+    assert not can_manage(admin, allow_admin=False)
+    assert not can_manage(reader)
+    with app.app_context(), app.test_request_context():
+        assert not can_manage_novel(novel)
+
+
+# id 复用
+def test_reused_user_id_is_rejected(app):
+    old = add_user("old", role="super_admin")
+    created = user_created(old.created_at)
+    assert identity_for(app, old, created).role == "super_admin"
+
+    # 在其他进程中删除，本进程缓存中仍是旧用户的身份
+    # 新注册的用户复用了同一个 id
+    user_id = old.id
+    db.session.delete(old)
+    db.session.commit()
+    new = add_user("new", created_at=datetime(2024, 6, 1))
+    assert new.id == user_id
+
+    identity = identity_for(app, new, user_created(new.created_at))
+    assert (identity.username, identity.role) == ("new", "reader")
+    assert identity_for(app, new, created) is None
+
+
+def test_session_of_deleted_user_is_rejected(app):
+    user = add_user("reader")
+    created = user_created(user.created_at)
+    assert identity_for(app, user, created) is not None
+
+    user.role = "deleting"
+    db.session.commit()
+    identity_cache.invalidate_user(user.id)
+    assert identity_for(app, user, created) is None
@@ -0,0 +1,207 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+
+import jobs
+from jobs import DONE, FAILED, PENDING, RUNNING, JobQueue, LeaseLost, run_job
+from models import db
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock, monkeypatch):
+    queue = JobQueue()
+    queue.path = str(tmp_path / "jobs.db")
+    queue.lease_seconds = 60
+    queue.retry_base_seconds = 5
+    # run_job 使用模块级的 job_queue
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    return queue
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    return app
+
+
+def row(queue, job_id):
+    conn = sqlite3.connect(queue.path)
+    conn.row_factory = sqlite3.Row
+    try:
+        stored = conn.execute("SELECT * FROM job WHERE id = ?", (job_id,))
+        return dict(stored.fetchone())
+    finally:
+        conn.close()
+
+
+# 入队和领取
+def test_enqueue_with_same_key_returns_existing_job(queue):
+    first = queue.enqueue("a", {"x": 1}, key="k")
+    second = queue.enqueue("a", {"x": 2}, key="k")
+    assert first == second
+    assert queue.stats() == {PENDING: 1}
+
+
+def test_enqueue_many_skips_existing_keys(queue):
+    queue.enqueue("a", {"x": 1}, key="k1")
+    added = queue.enqueue_many("a", [({"x": 1}, "k1"), ({"x": 2}, "k2"), ({}, "k2")])
+    assert added == 1
+    assert queue.enqueue_many("a", []) == 0
+    assert queue.stats() == {PENDING: 2}
+
+
+def test_claim_returns_due_jobs_in_run_at_order(queue, clock):
+    queue.enqueue("later", delay=10)
+    queue.enqueue("first")
+    queue.enqueue("second", delay=1)
+
+    job = queue.claim()
+    assert (job.name, job.attempts) == ("first", 1)
+    assert row(queue, job.id)["status"] == RUNNING
+    assert queue.claim() is None
+
+    clock.now += 1
+    assert queue.claim().name == "second"
+
+
+def test_expired_lease_is_claimed_again(queue, clock):
+    queue.enqueue("a")
+    first = queue.claim()
+    assert queue.claim() is None
+
+    clock.now += 61
+    second = queue.claim()
+    assert second.id == first.id
+    assert second.attempts == 2
+
+
+# 重试
+def test_failure_backs_off_exponentially_then_fails(queue, clock):
+    job_id = queue.enqueue("a", max_attempts=3)
+
+    job = queue.claim()
+    assert queue.fail(job, "boom")
+    assert row(queue, job_id)["run_at"] == clock.now + 5
+
+    clock.now += 5
+    job = queue.claim()
+    queue.fail(job, "boom")
+    assert row(queue, job_id)["run_at"] == clock.now + 10
+
+    clock.now += 10
+    job = queue.claim()
+    queue.fail(job, "boom")
+    stored = row(queue, job_id)
+    assert (stored["status"], stored["attempts"]) == (FAILED, 3)
+    assert stored["last_error"] == "boom"
+
+
+def test_retry_resets_failed_jobs_only(queue):
+    failed_id = queue.enqueue("a", max_attempts=1)
+    queue.fail(queue.claim(), "boom")
+    running_id = queue.enqueue("b")
+    queue.claim()
+
+    queue.retry(failed_id)
+    queue.retry(running_id)
+    assert row(queue, failed_id)["status"] == PENDING
+    assert row(queue, failed_id)["attempts"] == 0
+    assert row(queue, running_id)["status"] == RUNNING
+
+
+def test_requeue_resets_finished_job_with_same_key(queue):
+    job_id = queue.enqueue("a", key="k")
+    queue.complete(queue.claim())
+    assert queue.enqueue("a", key="k") == job_id
+    assert row(queue, job_id)["status"] == DONE
+
+    queue.enqueue("a", key="k", requeue=True)
+    assert row(queue, job_id)["status"] == PENDING
+
+
+# 租约
+def test_progress_renews_the_lease(queue, clock):
+    job_id = queue.enqueue("a")
+    job = queue.claim()
+
+    clock.now += 50
+    job.report_progress(done=1)
+    clock.now += 50
+    assert queue.claim() is None
+    assert row(queue, job_id)["locked_until"] == clock.now - 50 + 60
+
+
+def test_stale_worker_cannot_finish_a_reclaimed_job(queue, clock):
+    job_id = queue.enqueue("a")
+    stale = queue.claim()
+    clock.now += 61
+    current = queue.claim()
+
+    with pytest.raises(LeaseLost):
+        stale.report_progress(done=1)
+    assert not queue.complete(stale)
+    assert not queue.fail(stale, "late")
+    assert row(queue, job_id)["status"] == RUNNING
+
+    assert queue.complete(current)
+    assert row(queue, job_id)["status"] == DONE
+
+
+# 执行
+def test_run_job_completes_successful_jobs(app, queue, monkeypatch):
+    calls = []
+    monkeypatch.setitem(jobs._tasks, "ok", lambda job, value: calls.append(value))
+    job_id = queue.enqueue("ok", {"value": 3})
+
+    assert run_job(app, queue.claim())
+    assert calls == [3]
+    assert row(queue, job_id)["status"] == DONE
+
+
+def test_run_job_records_failures_for_retry(app, queue, monkeypatch):
+    def broken(job):
+        raise ValueError("boom")
+
+    monkeypatch.setitem(jobs._tasks, "broken", broken)
+    job_id = queue.enqueue("broken")
+
+    assert not run_job(app, queue.claim())
+    stored = row(queue, job_id)
+    assert stored["status"] == PENDING
+    assert "ValueError: boom" in stored["last_error"]
+
+
+def test_run_job_leaves_reclaimed_job_alone(app, queue, clock, monkeypatch):
+    def slow(job):
+        clock.now += 61
+        queue.claim()
+        job.report_progress(done=1)
+
+    monkeypatch.setitem(jobs._tasks, "slow", slow)
+    job_id = queue.enqueue("slow")
+
+    assert not run_job(app, queue.claim())
+    stored = row(queue, job_id)
+    assert (stored["status"], stored["attempts"], stored["last_error"]) == (
+        RUNNING,
+        2,
+        None,
+    )
@@ -0,0 +1,95 @@
+import pytest
+from flask import Flask
+from sqlalchemy import select, text
+
+from metrics import Metrics
+from models import User, db
+
+
+@pytest.fixture(scope="module")
+def metrics():
+    return Metrics()
+
+
+@pytest.fixture(scope="module")
+def client(metrics):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI="sqlite://")
+    db.init_app(app)
+    metrics.init_app(app, db)
+
+    @app.route("/columns")
+    def columns():
+        return str(len(db.session.execute(select(User.id, User.username)).all()))
+
+    @app.route("/entities")
+    def entities():
+        return str(len(User.query.all()))
+
+    @app.route("/raw")
+    def raw():
+        return str(db.session.execute(text("SELECT count(*) FROM user")).scalar())
+
+    @app.route("/stream")
+    def stream():
+        query = select(User).execution_options(yield_per=1)
+        return str(len(db.session.scalars(query).all()))
+
+    @app.route("/write")
+    def write():
+        db.session.execute(text("UPDATE user SET email = email WHERE id = 0"))
+        db.session.rollback()
+        return str(len(User.query.all()))
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            User(username=name, email=f"{name}@example.com") for name in "ab"
+        )
+        db.session.commit()
+        db.session.remove()
+    return app.test_client()
+
+
+def route(metrics, endpoint):
+    return metrics.routes[endpoint]
+
+
+def test_column_queries_count_rows_but_not_entities(client, metrics):
+    assert client.get("/columns").data == b"2"
+    stats = route(metrics, "columns")
+    assert (stats.rows, stats.entities) == (2, 0)
+
+
+def test_entity_queries_count_rows_and_entities(client, metrics):
+    assert client.get("/entities").data == b"2"
+    stats = route(metrics, "entities")
+    assert (stats.rows, stats.entities) == (2, 2)
+
+
+def test_text_queries_count_rows(client, metrics):
+    assert client.get("/raw").data == b"2"
+    assert route(metrics, "raw").rows == 1
+
+
+def test_streamed_queries_are_not_buffered(client, metrics):
+    assert client.get("/stream").data == b"2"
+    stats = route(metrics, "stream")
+    assert (stats.rows, stats.entities) == (0, 2)
+
+
+def test_text_writes_pass_through(client, metrics):
+    assert client.get("/write").data == b"2"
+    assert route(metrics, "write").rows == 2
+
+
+def test_failed_statement_leaves_no_timing_state(client, metrics):
+    app = client.application
+    with app.test_request_context():
+        app.preprocess_request()
+        info = db.session.connection().info
+        with pytest.raises(Exception):
+            db.session.execute(text("SELECT * FROM missing"))
+        db.session.rollback()
+        assert "_metrics_start" not in info
+        db.session.remove()
@@ -0,0 +1,123 @@
+from moderation import (
+    BLOCK,
+    MASK,
+    PASS,
+    REVIEW,
+    Automaton,
+    ModerationResult,
+    WordFilter,
+    merge_results,
+)
+
+
+def make_filter(directory, **lists):
+    """在 directory 下写入词库文件（文件名 -> 词列表）并加载"""
+    for name, words in lists.items():
+        (directory / f"{name}.txt").write_text("\n".join(words), encoding="utf-8")
+    word_filter = WordFilter()
+    word_filter.wordlist_dir = str(directory)
+    word_filter.list_actions = {"block": BLOCK, "mask": MASK, "review": REVIEW}
+    word_filter.reload_interval = 3600
+    word_filter.reload()
+    return word_filter
+
+
+# 自动机
+def test_automaton_finds_overlapping_words():
+    automaton = Automaton({"he": BLOCK, "she": BLOCK, "his": BLOCK, "hers": BLOCK})
+    matches = automaton.search("ushers")
+    assert sorted((start, end, word) for start, end, word, _ in matches) == [
+        (1, 3, "she"),
+        (2, 3, "he"),
+        (2, 5, "hers"),
+    ]
+
+
+def test_automaton_follows_fail_links_after_mismatch():
+    automaton = Automaton({"abcd": BLOCK, "bce": MASK})
+    assert automaton.search("abce") == [(1, 3, "bce", MASK)]
+
+
+def test_empty_automaton_matches_nothing():
+    automaton = Automaton({})
+    assert automaton.size == 0
+    assert automaton.search("任意文本") == []
+
+
+# 过滤器
+def test_clean_text_passes_unchanged(tmp_path):
+    word_filter = make_filter(tmp_path, block=["赌博"])
+    assert word_filter.check("今天天气不错") == ModerationResult(
+        PASS, "今天天气不错", []
+    )
+
+
+def test_block_and_review_keep_text(tmp_path):
+    word_filter = make_filter(tmp_path, block=["赌博"], review=["可疑"])
+    assert word_filter.check("这里有赌博") == ModerationResult(
+        BLOCK, "这里有赌博", ["赌博"]
+    )
+    assert word_filter.check("有点可疑") == ModerationResult(
+        REVIEW, "有点可疑", ["可疑"]
+    )
+
+
+def test_mask_replaces_only_matched_characters(tmp_path):
+    word_filter = make_filter(tmp_path, mask=["笨蛋"])
+    result = word_filter.check("你这个笨 蛋！")
+    assert result.action == MASK
+    assert result.text == "你这个* *！"
+    assert result.words == ["笨蛋"]
+
+
+def test_normalizes_width_case_and_variants(tmp_path):
+    word_filter = make_filter(tmp_path, block=["abc", "你好"])
+    assert word_filter.check("ＡＢＣ").action == BLOCK
+    assert word_filter.check("妳好").action == BLOCK
+    assert word_filter.check("a-b*c").action == BLOCK
+
+
+def test_variants_file_extends_mapping(tmp_path):
+    (tmp_path / "variants.txt").write_text("徳 德\n", encoding="utf-8")
+    word_filter = make_filter(tmp_path, block=["道德"])
+    assert word_filter.check("道徳").action == BLOCK
+
+
+def test_word_in_several_lists_uses_most_severe_action(tmp_path):
+    word_filter = make_filter(tmp_path, mask=["坏词"], block=["坏词"])
+    result = word_filter.check("一个坏词")
+    assert result.action == BLOCK
+    assert result.text == "一个坏词"
+
+
+def test_most_severe_match_wins_and_masks_still_apply(tmp_path):
+    word_filter = make_filter(tmp_path, mask=["笨蛋"], review=["可疑"])
+    result = word_filter.check("笨蛋很可疑")
+    assert result.action == REVIEW
+    assert result.text == "**很可疑"
+    assert result.words == ["笨蛋", "可疑"]
+
+
+def test_reload_picks_up_changed_lists(tmp_path):
+    word_filter = make_filter(tmp_path, block=["旧词"])
+    (tmp_path / "block.txt").write_text("新词\n", encoding="utf-8")
+    word_filter.reload()
+    assert word_filter.check("旧词").action == PASS
+    assert word_filter.check("新词").action == BLOCK
+
+
+def test_comments_and_blank_lines_are_ignored(tmp_path):
+    word_filter = make_filter(tmp_path, block=["# 注释", "", "赌博"])
+    assert word_filter.automaton.size == 1
+
+
+def test_merge_results_takes_most_severe_and_dedupes_words():
+    action, words = merge_results(
+        [
+            ModerationResult(MASK, "", ["甲"]),
+            ModerationResult(BLOCK, "", ["乙", "甲"]),
+            ModerationResult(PASS, "", []),
+        ]
+    )
+    assert action == BLOCK
+    assert words == ["甲", "乙"]
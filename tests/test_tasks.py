@@ -0,0 +1,123 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+import jobs
+import tasks
+from covers import covers
+from jobs import JobQueue
+from models import Chapter, Novel, User, db
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = JobQueue()
+    queue.path = str(tmp_path / "jobs.db")
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    monkeypatch.setattr(tasks, "job_queue", queue)
+    return queue
+
+
+@pytest.fixture
+def app(queue, tmp_path, monkeypatch):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+        JOBS_RECONCILE_WINDOW=3600,
+    )
+    db.init_app(app)
+    monkeypatch.setattr(covers, "directory", str(tmp_path / "covers"))
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def add_user(name, role="reader"):
+    user = User(username=name, email=f"{name}@example.com", role=role)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_novel(author, **fields):
+    novel = Novel(title="小说", author_id=author.id, **fields)
+    db.session.add(novel)
+    db.session.commit()
+    return novel
+
+
+def add_chapter(novel, age=timedelta(0)):
+    chapter = Chapter(
+        title="第一章",
+        content="正文",
+        chapter_number=1,
+        novel_id=novel.id,
+        created_at=datetime.utcnow() - age,
+    )
+    db.session.add(chapter)
+    db.session.commit()
+    return chapter
+
+
+def queued(queue):
+    conn = sqlite3.connect(queue.path)
+    try:
+        return sorted(
+            conn.execute("SELECT name, idempotency_key FROM job").fetchall()
+        )
+    finally:
+        conn.close()
+
+
+def test_reconcile_requeues_lost_purges(app, queue):
+    author = add_user("author")
+    novel = add_novel(author, status="deleting")
+    add_novel(author)
+    deleted = add_user("deleted", role="deleting")
+    # 作者正在删除时，作品随 purge_user 一起删除
+    add_novel(deleted, status="deleting")
+
+    assert tasks.reconcile(3600) == 2
+    assert queued(queue) == [
+        ("purge_novel", tasks.purge_novel_job(novel.id, novel.created_at)[1]),
+        ("purge_user", tasks.purge_user_job(deleted.id, deleted.created_at)[1]),
+    ]
+    # 与网页请求使用相同的 key，已入队的任务不会重复
+    assert tasks.reconcile(3600) == 0
+
+
+def test_reconcile_requeues_recent_fanouts(app, queue):
+    author = add_user("author")
+    novel = add_novel(author)
+    recent = add_chapter(novel)
+    add_chapter(novel, age=timedelta(hours=2))
+    add_chapter(add_novel(author, status="deleting"))
+    queue.enqueue("fanout_chapter", *tasks.fanout_job(recent.id, recent.created_at))
+
+    # 已入队的章节、超出时间范围的章节和正在删除的小说的章节都不会再入队
+    assert tasks.reconcile(3600) == 1
+    assert [name for name, _ in queued(queue)] == ["fanout_chapter", "purge_novel"]
+
+
+def test_reconcile_requeues_unfinished_covers(app, queue):
+    author = add_user("author")
+    uploaded = add_novel(author, cover_hash="ab" * 32)
+    linked = add_novel(author, cover_image="https://example.com/a.jpg")
+    add_novel(author)
+
+    assert tasks.reconcile(3600) == 2
+    assert queued(queue) == [
+        ("import_cover", tasks.import_cover_job(linked.id, linked.cover_image)[1]),
+        ("process_cover", tasks.process_cover_job(uploaded.cover_hash)[1]),
+    ]
+
+
+def test_worker_reconcile_logs_errors(app, monkeypatch):
+    def broken(window):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(tasks, "reconcile", broken)
+    assert jobs.reconcile(app) == 0
@@ -0,0 +1,42 @@
+"""启动后台任务工作进程
+
+用法:
+    python worker.py --processes 2
+    python worker.py --stats
+"""
+
+import argparse
+import multiprocessing
+
+from app import app
+from jobs import job_queue, work
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后台任务工作进程")
+    parser.add_argument("--processes", type=int, default=1, help="工作进程数")
+    parser.add_argument("--stats", action="store_true", help="查看各状态的任务数后退出")
+    args = parser.parse_args()
+
+    if args.stats:
+        for status, total in sorted(job_queue.stats().items()):
+            print(f"{status}: {total}")
+        return
+
+    processes = [
+        multiprocessing.Process(target=work, args=(app,), name=f"job-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    print(f"已启动 {len(processes)} 个工作进程，按 Ctrl+C 退出")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()